@@ -0,0 +1,98 @@
+"""
+Compares the scheduling modes of core.unique_queue.UniqueQueue.
+
+Runs the dispatcher with simulated transfers: every file takes a fixed
+latency plus its size divided by the rate of a connection. The workload
+queues lecture recordings in front of many small documents on the same
+two hosts, like a course that links its recordings on moodle. Reports the time until the
+first N files are done and the total makespan in simulated seconds.
+
+usage: python benchmarks/scheduling.py [--files 300] [--videos 12] [--seed 0]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.concurrency import ConcurrencyController, HostSlot  # noqa: E402
+from core.constants import ALL_SCHEDULING_MODES  # noqa: E402
+from core.unique_queue import UniqueQueue, get_host  # noqa: E402
+
+MB = 1024 * 1024
+LATENCY = 0.1
+RATE = 20 * MB
+LIMIT_PER_HOST = 5
+CONSUMERS = 20
+# simulated seconds per real second
+TIME_SCALE = 20
+MILESTONES = [10, 50, 100]
+
+
+class FixedLimits(ConcurrencyController):
+    def __init__(self, limit):
+        super().__init__(SimpleNamespace(conn_limit_per_host=limit))
+        self.initial_limit = limit
+
+
+def create_workload(files, videos, seed):
+    rng = random.Random(seed)
+    hosts = ["moodle.example.com", "polybox.example.com"]
+    items = []
+    for i in range(videos):
+        size = rng.randint(300, 1500) * MB
+        # moodle doesn't know the size, the extension gives it away
+        items.append(({"url": f"https://{rng.choice(hosts)}/v{i}", "path": f"video{i}.mp4"}, size, None))
+    for i in range(files):
+        size = int(rng.lognormvariate(13.5, 1.2))
+        host = rng.choice(hosts)
+        items.append(({"url": f"https://{host}/{i}", "path": f"file{i}.pdf"}, size, size))
+    return items
+
+
+async def consumer(queue, sizes, finished, start):
+    while True:
+        item = await queue.get()
+        async with HostSlot(queue.controller, get_host(item)):
+            await asyncio.sleep((LATENCY + sizes[item["path"]] / RATE) / TIME_SCALE)
+        finished.append((time.perf_counter() - start) * TIME_SCALE)
+        queue.task_done(item)
+
+
+async def run(scheduling, workload):
+    queue = UniqueQueue(FixedLimits(LIMIT_PER_HOST), scheduling)
+    sizes = {}
+    for item, size, known_size in workload:
+        sizes[item["path"]] = size
+        await queue.put({**item, "size": known_size})
+
+    finished = []
+    start = time.perf_counter()
+    consumers = [asyncio.ensure_future(consumer(queue, sizes, finished, start)) for _ in range(CONSUMERS)]
+    await queue.join()
+    for c in consumers:
+        c.cancel()
+    return finished
+
+
+async def main(files, videos, seed):
+    workload = create_workload(files, videos, seed)
+    header = "".join(f"{f'first {n}':>10}" for n in MILESTONES)
+    print(f"{'mode':>18}{header}{'makespan':>10}")
+    for scheduling in ALL_SCHEDULING_MODES:
+        finished = await run(scheduling, workload)
+        milestones = "".join(f"{finished[n - 1]:9.1f}s" for n in MILESTONES if n <= len(finished))
+        print(f"{scheduling:>18}{milestones}{finished[-1]:9.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--files", type=int, default=300)
+    parser.add_argument("--videos", type=int, default=12)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(args.files, args.videos, args.seed))
@@ -0,0 +1,108 @@
+"""
+Compares the old 8 KB read/write/md5 loop with core.sink.
+
+Serves a random file from a local aiohttp server and downloads it with
+both write paths. Besides the throughput it reports the longest time
+the event loop was blocked, which affects every other running download.
+
+usage: python benchmarks/sink.py [--size-mb 512] [--runs 3]
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+import time
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.sink import create_sink, iter_chunks, preallocate  # noqa: E402
+
+PORT = 8766
+
+
+async def legacy_path(response, path):
+    file_hash = hashlib.md5()
+    with open(path, "wb") as f:
+        while True:
+            chunk = await response.content.read(8192)
+            if not chunk:
+                break
+            f.write(chunk)
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+async def sink_path(response, path):
+    file_hash = hashlib.md5()
+    with open(path, "wb") as f:
+        preallocate(f, response.content_length)
+        sink = create_sink(f, response.content_length, on_write=file_hash.update)
+        try:
+            async for chunk in iter_chunks(response):
+                await sink.write(chunk)
+            await sink.close()
+        finally:
+            sink.abort()
+    return file_hash.hexdigest()
+
+
+async def measure_lag(stop_event, result):
+    while not stop_event.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(0.001)
+        result.append(time.perf_counter() - start - 0.001)
+
+
+async def run_once(session, write_path, out_path):
+    stop_event = asyncio.Event()
+    lags = []
+    lag_task = asyncio.ensure_future(measure_lag(stop_event, lags))
+    start = time.perf_counter()
+    async with session.get(f"http://127.0.0.1:{PORT}/file") as response:
+        digest = await write_path(response, out_path)
+    elapsed = time.perf_counter() - start
+    stop_event.set()
+    await lag_task
+    return elapsed, max(lags, default=0), digest
+
+
+async def main(size_mb, runs):
+    src = tempfile.NamedTemporaryFile(delete=False)
+    with src:
+        for _ in range(size_mb):
+            src.write(os.urandom(1024 * 1024))
+    expected = hashlib.md5(open(src.name, "rb").read()).hexdigest()
+
+    app = web.Application()
+    app.router.add_get("/file", lambda request: web.FileResponse(src.name))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", PORT).start()
+
+    out_path = src.name + ".out"
+    try:
+        async with aiohttp.ClientSession() as session:
+            for name, write_path in [("legacy", legacy_path), ("sink", sink_path)]:
+                for run in range(runs):
+                    elapsed, max_lag, digest = await run_once(session, write_path, out_path)
+                    assert digest == expected, "hash mismatch"
+                    print(f"{name:>6} run {run + 1}: {size_mb / elapsed:8.1f} MB/s, "
+                          f"max loop stall {max_lag * 1000:6.2f} ms")
+    finally:
+        await runner.cleanup()
+        os.remove(src.name)
+        if os.path.exists(out_path):
+            os.remove(out_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--size-mb", type=int, default=512)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(args.size_mb, args.runs))
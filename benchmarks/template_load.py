@@ -0,0 +1,102 @@
+"""
+Measures Template.load on a synthetic template.
+
+Writes a template with the given number of nodes: semesters with lecture
+folders, which contain moodle, polybox and video portal sites. Reports the
+time to parse the yaml with the pure python and the C loader and the time
+of a cold and of a compiled load of the whole template.
+
+usage: python benchmarks/template_load.py [--nodes 5000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import yaml
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SITES = [
+    {"module": "moodle", "id": 12345, "process_external_links": True, "keep_section_order": False},
+    {"module": "polybox", "poly_id": "YrFA3IT7FhemOAs", "poly_type": "s", "folder_name": "Polybox"},
+    {"module": "video_portal", "department": "d-infk", "year": 2021, "semester": "S", "course_id": "252-0027-00L",
+     "folder_name": "Recordings"},
+]
+FOLDERS_PER_SEMESTER = 20
+
+
+def create_template(nodes):
+    semesters = []
+    count = 0
+    while count < nodes:
+        lectures = []
+        semesters.append({"folder": f"Semester {len(semesters)}", "children": lectures})
+        count += 1
+        for i in range(FOLDERS_PER_SEMESTER):
+            if count >= nodes:
+                break
+            sites = []
+            lectures.append({"folder": f"Lecture {i}", "meta_data": {"check_state": 2}, "children": sites})
+            count += 1
+            while count < nodes and len(sites) < 20:
+                site = dict(SITES[count % len(SITES)])
+                site["allowed_extensions"] = ["pdf", "zip"]
+                site["meta_data"] = {"check_state": 2}
+                if "id" in site:
+                    site["id"] += count
+                sites.append(site)
+                count += 1
+    return {"children": semesters}
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main(nodes, repeat, directory):
+    from core import template_parser
+    from core.template_parser import compiled
+
+    path = os.path.join(directory, "template.yml")
+    with open(path, "w") as f:
+        yaml.dump(create_template(nodes), f, Dumper=getattr(yaml, "CSafeDumper", yaml.SafeDumper), sort_keys=False)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    def cold_load():
+        os.remove(compiled.get_path(compiled.get_key(content)))
+        template_parser.Template(path=path).load()
+
+    def compiled_load():
+        template_parser.Template(path=path).load()
+
+    template = template_parser.Template(path=path)
+    template.load()
+    print(f"{len(list(template)) - 1} nodes, {len(content) / 1024:.0f} KiB of yaml")
+
+    results = [("yaml.Loader", measure(lambda: yaml.load(content, Loader=yaml.Loader), repeat))]
+    if hasattr(yaml, "CSafeLoader"):
+        results.append(("yaml.CSafeLoader", measure(lambda: yaml.load(content, Loader=yaml.CSafeLoader), repeat)))
+    results.append(("cold load", measure(cold_load, repeat)))
+    results.append(("compiled load", measure(compiled_load, repeat)))
+
+    for name, seconds in results:
+        print(f"{name:>18}{seconds * 1000:10.1f}ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as app_data_path:
+        # the settings parse sys.argv, the cache must not end up in the real app data
+        sys.argv = [sys.argv[0], "--app-data-path", app_data_path]
+        main(args.nodes, args.repeat, app_data_path)
@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+BURST_SECONDS = 0.5
+MIN_BURST = 64 * 1024
+PROFILE_CHECK_INTERVAL = 30
+
+
+def parse_host_limits(values):
+    # "host=KB/s"
+    result = {}
+    for value in values or []:
+        host, _, limit = value.partition("=")
+        try:
+            result[host.strip().lower()] = int(limit) * 1024
+        except ValueError:
+            logger.warning(f"Could not parse bandwidth limit '{value}'. Expected 'host=KB/s'")
+    return result
+
+
+def parse_time(value):
+    hour, minute = value.strip().split(":")
+    return datetime.time(int(hour), int(minute))
+
+
+def parse_profiles(values):
+    # "HH:MM-HH:MM=KB/s"
+    result = []
+    for value in values or []:
+        time_range, _, limit = value.partition("=")
+        try:
+            start, end = time_range.split("-")
+            result.append((parse_time(start), parse_time(end), int(limit) * 1024))
+        except ValueError:
+            logger.warning(f"Could not parse bandwidth profile '{value}'. Expected 'HH:MM-HH:MM=KB/s'")
+    return result
+
+
+def get_profile_rate(profiles, default, now):
+    for start, end, rate in profiles:
+        if start < end:
+            if start <= now < end:
+                return rate
+        elif now >= start or now < end:
+            # the range goes over midnight, or is the whole day if start == end
+            return rate
+    return default
+
+
+class TokenBucket(object):
+    """
+    Chunks are always accepted and can leave the bucket in debt,
+    the caller then waits until the debt is paid back.
+    """
+
+    def __init__(self, rate):
+        self.rate = None
+        self.capacity = None
+        self.tokens = 0
+        self.last = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        self.rate = rate
+        self.capacity = max(rate * BURST_SECONDS, MIN_BURST)
+        self.tokens = min(self.tokens, self.capacity)
+
+    def reserve(self, amount):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+        self.last = now
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0
+        return -self.tokens / self.rate
+
+
+class BandwidthLimiter(object):
+    def __init__(self, download_settings):
+        self.default_rate = download_settings.bandwidth_limit * 1024
+        self.host_rates = parse_host_limits(download_settings.host_bandwidth_limits)
+        self.profiles = parse_profiles(download_settings.bandwidth_profiles)
+
+        self.global_bucket = None
+        self.host_buckets = {host: TokenBucket(rate) for host, rate in self.host_rates.items() if rate}
+        self.profile_checked_at = None
+        self.update_global_rate()
+
+    def update_global_rate(self):
+        rate = get_profile_rate(self.profiles, self.default_rate, datetime.datetime.now().time())
+        self.profile_checked_at = time.monotonic()
+
+        current_rate = self.global_bucket.rate if self.global_bucket is not None else 0
+        if rate == current_rate:
+            return
+
+        if not rate:
+            logger.debug("Removing the bandwidth limit")
+            self.global_bucket = None
+            return
+
+        logger.debug(f"Limiting the bandwidth to {rate // 1024} KB/s")
+        if self.global_bucket is None:
+            self.global_bucket = TokenBucket(rate)
+        else:
+            self.global_bucket.set_rate(rate)
+
+    async def consume(self, host, amount):
+        if self.profiles and time.monotonic() - self.profile_checked_at > PROFILE_CHECK_INTERVAL:
+            self.update_global_rate()
+
+        delay = 0
+        if self.global_bucket is not None:
+            delay = self.global_bucket.reserve(amount)
+        host_bucket = self.host_buckets.get(host, None)
+        if host_bucket is not None:
+            delay = max(delay, host_bucket.reserve(amount))
+
+        if delay:
+            await asyncio.sleep(delay)
+
+
+def create_limiter(download_settings):
+    if not download_settings.bandwidth_limit and \
+            not download_settings.host_bandwidth_limits and \
+            not download_settings.bandwidth_profiles:
+        return None
+    return BandwidthLimiter(download_settings)
@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+MIN_HOST_LIMIT = 1
+MAX_HOST_LIMIT = 16
+INITIAL_HOST_LIMIT = 2
+MAX_CONSUMERS = 100
+
+# a window is ok as long as the latency stays below this factor of the best latency
+LATENCY_TOLERANCE = 2.0
+DECREASE_COOLDOWN = 1.0
+THROTTLE_STATUS = {429, 503}
+
+
+def get_consumer_count(download_settings):
+    if download_settings.conn_limit == 0:
+        return MAX_CONSUMERS
+    return min(download_settings.conn_limit, MAX_CONSUMERS)
+
+
+class HostSlot(object):
+    def __init__(self, controller, host):
+        self.controller = controller
+        self.host = host
+
+    async def __aenter__(self):
+        if self.controller is not None:
+            await self.controller.acquire(self.host)
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.controller is not None:
+            self.controller.release(self.host)
+
+
+class HostState(object):
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self.waiters = collections.deque()
+
+        self.latency = None
+        self.min_latency = None
+        self.throughput = 0
+        self.errors = 0
+        self.throttled = 0
+        self.last_decrease = 0
+
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.window_latency = 0
+        self.window_bytes = 0
+
+    def reset_window(self):
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.window_latency = 0
+        self.window_bytes = 0
+
+    def to_dict(self):
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "latency": self.latency,
+            "throughput": self.throughput,
+            "errors": self.errors,
+            "throttled": self.throttled,
+        }
+
+
+class ConcurrencyController(object):
+    """
+    Limits the number of parallel connections per host. It is the only place,
+    which counts them: a download takes a slot with HostSlot only for its transfer,
+    so checking existing files never waits, and segmented downloads take the free
+    ones for their extra connections. The limit grows by one
+    after each window of 'limit' successful requests, as long as the latency
+    stays close to the best one seen or the throughput still improves
+    (additive increase) and is halved on errors or throttling (multiplicative decrease).
+    """
+
+    def __init__(self, download_settings, signals=None):
+        if download_settings.conn_limit_per_host == 0:
+            self.max_limit = MAX_HOST_LIMIT
+        else:
+            self.max_limit = download_settings.conn_limit_per_host
+        self.initial_limit = min(INITIAL_HOST_LIMIT, self.max_limit)
+        self.signals = signals
+        self.hosts = {}
+
+    def _get_state(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostState(self.initial_limit)
+        return self.hosts[host]
+
+    def get_limit(self, host):
+        return self._get_state(host).limit
+
+    def has_free_slot(self, host):
+        state = self._get_state(host)
+        return state.in_flight < state.limit and not state.waiters
+
+    async def acquire(self, host):
+        state = self._get_state(host)
+        if state.in_flight < state.limit and not state.waiters:
+            state.in_flight += 1
+            return
+
+        future = asyncio.get_event_loop().create_future()
+        state.waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError as e:
+            if future.done() and not future.cancelled():
+                self.release(host)
+            raise e
+
+    def try_acquire(self, host):
+        """Takes a slot only if one is free right now, for connections a download can do without"""
+        if not self.has_free_slot(host):
+            return False
+        self._get_state(host).in_flight += 1
+        return True
+
+    def release(self, host):
+        state = self._get_state(host)
+        state.in_flight -= 1
+        self._wake_up(state)
+
+    @staticmethod
+    def _wake_up(state):
+        while state.waiters and state.in_flight < state.limit:
+            future = state.waiters.popleft()
+            if not future.done():
+                state.in_flight += 1
+                future.set_result(None)
+
+    def record_bytes(self, host, length):
+        self._get_state(host).window_bytes += length
+
+    def record_response(self, host, latency, status):
+        state = self._get_state(host)
+        if status in THROTTLE_STATUS:
+            state.throttled += 1
+            self._decrease(host, state, f"throttled with {status}")
+            return
+
+        if status >= 500:
+            state.errors += 1
+            self._decrease(host, state, f"server error {status}")
+            return
+
+        if state.min_latency is None or latency < state.min_latency:
+            state.min_latency = latency
+
+        # requests sent before the window started saw the old limit
+        if time.monotonic() - latency < state.window_start:
+            return
+        state.window_count += 1
+        state.window_latency += latency
+
+        if state.window_count >= state.limit:
+            self._end_window(host, state)
+
+    def record_error(self, host, error):
+        state = self._get_state(host)
+        state.errors += 1
+        self._decrease(host, state, f"{type(error).__name__}")
+
+    def _end_window(self, host, state):
+        elapsed = max(time.monotonic() - state.window_start, 1e-3)
+        throughput = state.window_bytes / elapsed
+        latency = state.window_latency / state.window_count
+
+        latency_ok = latency <= LATENCY_TOLERANCE * state.min_latency
+        throughput_improved = throughput > state.throughput * 1.05
+
+        state.latency = latency
+        state.throughput = throughput
+        state.reset_window()
+
+        if latency_ok or throughput_improved:
+            self._set_limit(host, state, min(state.limit + 1, self.max_limit), "window ok")
+        else:
+            self._set_limit(host, state, max(state.limit - 1, MIN_HOST_LIMIT), "latency increased")
+
+    def _decrease(self, host, state, reason):
+        # a window with a failure never increases the limit
+        state.reset_window()
+        now = time.monotonic()
+        # but a burst of failures only halves it once per round trip
+        cooldown = DECREASE_COOLDOWN if state.latency is None else min(state.latency, DECREASE_COOLDOWN)
+        if now - state.last_decrease < cooldown:
+            return
+        state.last_decrease = now
+        self._set_limit(host, state, max(state.limit // 2, MIN_HOST_LIMIT), reason)
+
+    def _set_limit(self, host, state, limit, reason):
+        if limit == state.limit:
+            return
+
+        latency = f"{state.latency * 1000:.0f} ms" if state.latency is not None else "-"
+        logger.debug(f"Concurrency limit for {host}: {state.limit} -> {limit} ({reason}). "
+                     f"Latency: {latency}, throughput: {state.throughput / 1024 / 1024:.2f} MB/s, "
+                     f"errors: {state.errors}, throttled: {state.throttled}")
+        state.limit = limit
+        self._wake_up(state)
+        self.emit_stats()
+
+    def get_stats(self):
+        return {host: state.to_dict() for host, state in self.hosts.items()}
+
+    def emit_stats(self):
+        if self.signals is not None:
+            self.signals.host_limits_changed.emit(self.get_stats())
+
+    def log_stats(self):
+        for host, stats in self.get_stats().items():
+            logger.debug(f"Host {host}: limit {stats['limit']}, "
+                         f"throughput {stats['throughput'] / 1024 / 1024:.2f} MB/s, "
+                         f"errors {stats['errors']}, throttled {stats['throttled']}")
@@ -17,9 +17,38 @@ FORCE_DOWNLOAD_BLACKLIST = ["ilias-app2.let.ethz.ch",
                             "drive.google.com"]
 
 MOVIE_EXTENSIONS = {"mp4", "webm", "avi", "mkv", "mov", "m4v"}
+
+# (offset, magic bytes, extension), used if the headers don't tell the extension
+FILE_SIGNATURES = [
+    (0, b"%PDF-", "pdf"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (0, b"\xff\xd8\xff", "jpg"),
+    (0, b"GIF8", "gif"),
+    (0, b"PK\x03\x04", "zip"),
+    (0, b"Rar!\x1a\x07", "rar"),
+    (0, b"7z\xbc\xaf\x27\x1c", "7z"),
+    (0, b"\x1f\x8b", "gz"),
+    (0, b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1", "doc"),
+    (0, b"\x1aE\xdf\xa3", "mkv"),
+    (4, b"ftyp", "mp4"),
+]
+SNIFF_SIZE = 16
+
+# strongest first
+CONTENT_HASH_ALGORITHMS = ["sha256", "sha1", "md5"]
 ACTION_NEW = 0
 ACTION_REPLACE = 1
 
+DEDUP_OFF = "off"
+DEDUP_HARDLINK = "hardlink"
+DEDUP_REFLINK = "reflink"
+ALL_DEDUP_METHODS = [DEDUP_OFF, DEDUP_HARDLINK, DEDUP_REFLINK]
+
+SCHEDULING_FIFO = "in order"
+SCHEDULING_SHORTEST_FIRST = "shortest first"
+SCHEDULING_SMALL_FIRST = "small files first"
+ALL_SCHEDULING_MODES = [SCHEDULING_FIFO, SCHEDULING_SHORTEST_FIRST, SCHEDULING_SMALL_FIRST]
+
 CORE_PATH = os.path.dirname(__file__)
 
 ROOT_PATH = os.path.dirname(CORE_PATH)
@@ -28,6 +57,8 @@ PASSWORD_MISSING_WORD = "INSERT PASSWORD"
 
 APP_NAME = "ethz-document-fetcher"
 
+STAGING_FOLDER_NAME = f".{APP_NAME}-staging"
+
 VERSION_FILE_PATH = os.path.join(ROOT_PATH, "version.txt")
 
 with open(VERSION_FILE_PATH) as f:
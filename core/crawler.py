@@ -0,0 +1,91 @@
+import asyncio
+import collections
+import contextvars
+import logging
+
+logger = logging.getLogger(__name__)
+
+# listing requests of all producers of a session, which run at the same time
+CRAWL_CONCURRENCY = 8
+# more sub folders than this are crawled by the job, which found them
+MAX_PENDING_JOBS = 1000
+
+# the traversal of the run, which started the current worker
+current_traversal = contextvars.ContextVar("current_traversal", default=None)
+
+
+class Traversal(object):
+    def __init__(self):
+        self.pending = collections.deque()
+        self.active = 0
+        self.condition = asyncio.Condition()
+
+
+class Crawler(object):
+    """
+    Runs the listing jobs of recursive producers with at most limit of them at the same time,
+    so large shares don't take the connections away from the downloads. One crawler is
+    shared by all producers of a session, every run only waits for its own jobs.
+    Jobs are kept as functions with their arguments until a worker is free, the newest first,
+    so files of deep trees are found early. If a job fails, the other jobs of the run
+    are cancelled and the error is raised by run.
+
+    usage:
+        async def parse_folder(crawler, url):
+            ...
+            await crawler.spawn(parse_folder, crawler, sub_folder_url)
+
+        await session.crawler.run(parse_folder, session.crawler, url)
+    """
+
+    def __init__(self, limit=CRAWL_CONCURRENCY, max_pending=MAX_PENDING_JOBS):
+        self.limit = limit
+        self.max_pending = max_pending
+        self.semaphore = None
+
+    async def run(self, func, *args, **kwargs):
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.limit)
+
+        traversal = Traversal()
+        traversal.pending.append((func, args, kwargs))
+        workers = [asyncio.ensure_future(self._worker(traversal)) for _ in range(self.limit)]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException as e:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            traversal.pending.clear()
+            raise e
+
+    async def spawn(self, func, *args, **kwargs):
+        traversal = current_traversal.get()
+        if traversal is None or len(traversal.pending) >= self.max_pending:
+            await func(*args, **kwargs)
+            return
+
+        async with traversal.condition:
+            traversal.pending.append((func, args, kwargs))
+            traversal.condition.notify()
+
+    async def _worker(self, traversal):
+        # the worker runs in its own task, so this is only seen by its jobs
+        current_traversal.set(traversal)
+        while True:
+            async with traversal.condition:
+                await traversal.condition.wait_for(lambda: traversal.pending or traversal.active == 0)
+                if not traversal.pending:
+                    # nothing is running, which could find more
+                    traversal.condition.notify_all()
+                    return
+                func, args, kwargs = traversal.pending.pop()
+                traversal.active += 1
+
+            try:
+                async with self.semaphore:
+                    await func(*args, **kwargs)
+            finally:
+                async with traversal.condition:
+                    traversal.active -= 1
+                    traversal.condition.notify_all()
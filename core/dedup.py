@@ -0,0 +1,113 @@
+import logging
+import os
+
+from core import staging
+from core.constants import DEDUP_OFF, DEDUP_REFLINK
+from core.storage import cache
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# from linux/fs.h
+FICLONE = 0x40049409
+
+stats = {
+    "linked_files": 0,
+    "saved_bytes": 0,
+}
+
+
+def reset_stats():
+    stats["linked_files"] = 0
+    stats["saved_bytes"] = 0
+
+
+def _get_blob(content_hash):
+    entry = cache.get_json("blobs").get(content_hash, None)
+    if entry is None:
+        return None
+
+    try:
+        stat = os.stat(entry["path"])
+    except OSError:
+        return None
+
+    # the file was modified in place since we registered it
+    if stat.st_size != entry["size"] or stat.st_mtime_ns != entry["mtime"]:
+        return None
+
+    return entry
+
+
+def _register_blob(absolute_path, content_hash):
+    stat = os.stat(absolute_path)
+    cache.get_json("blobs")[content_hash] = {
+        "path": absolute_path,
+        "size": stat.st_size,
+        "mtime": stat.st_mtime_ns,
+    }
+
+
+def _reflink(src, dst):
+    if fcntl is None:
+        raise OSError("Reflinks are not supported on this platform")
+    with open(src, "rb") as f_src, open(dst, "wb") as f_dst:
+        fcntl.ioctl(f_dst.fileno(), FICLONE, f_src.fileno())
+
+
+def _link_into_place(src, absolute_path, method, save_path):
+    temp_path = staging.get_temp_path(save_path)
+    try:
+        if method == DEDUP_REFLINK:
+            _reflink(src, temp_path)
+        else:
+            os.link(src, temp_path)
+        os.replace(temp_path, absolute_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def deduplicate(absolute_path, content_hash, download_settings):
+    """
+    Replaces absolute_path with a link to an already downloaded file with the
+    same content. If linking isn't possible, the downloaded copy is kept.
+    Returns whether the file was replaced with a link.
+    """
+    method = download_settings.deduplication
+    if method == DEDUP_OFF:
+        return False
+
+    blob = _get_blob(content_hash)
+    if blob is None or blob["path"] == absolute_path:
+        _register_blob(absolute_path, content_hash)
+        return False
+
+    if os.path.samefile(blob["path"], absolute_path):
+        return False
+
+    if os.path.getsize(absolute_path) != blob["size"]:
+        _register_blob(absolute_path, content_hash)
+        return False
+
+    try:
+        _link_into_place(blob["path"], absolute_path, method, download_settings.save_path)
+    except OSError as e:
+        logger.debug(f"Could not {method} {blob['path']} to {absolute_path}. "
+                     f"{type(e).__name__}: {e}. Keeping the copy")
+        return False
+
+    logger.debug(f"Deduplicated {absolute_path} with {blob['path']}")
+    stats["linked_files"] += 1
+    stats["saved_bytes"] += blob["size"]
+    return True
+
+
+def log_stats():
+    if stats["linked_files"]:
+        logger.info(f"Deduplicated {stats['linked_files']} file(s), "
+                    f"saved {stats['saved_bytes'] / 1024 / 1024:.1f} MB of disk space")
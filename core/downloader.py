@@ -1,29 +1,34 @@
 import asyncio
+import contextlib
 import functools
-import hashlib
 import pathlib
-import random
-import shutil
 
 import aiohttp
 import fitz
 from aiohttp.client import URL
 
 import core.utils
-from core import pdf_highlighter
+from core import pdf_highlighter, segmented, staging, dedup, local_index
+from core.concurrency import HostSlot
 from core.constants import *
+from core.partial_download import PartialDownload, open_partial_response
+from core.rules import compile_rules
+from core.sink import iter_chunks, read_prefix
 from core.storage import cache
+from core.storage.policy import set_owner
 
 logger = logging.getLogger(__name__)
 
 
-async def download_files(session: aiohttp.ClientSession, queue):
+async def download_files(session: aiohttp.ClientSession, queue, controller=None):
     while True:
         item = await queue.get()
         unique_key = item["unique_key"]
         signal_handler = item["signal_handler"]
+        # cache entries written while downloading belong to the site of the item
+        set_owner(item.pop("owner", None))
         try:
-            await download_if_not_exist(session, **item)
+            await download_if_not_exist(session, controller=controller, **item)
         except asyncio.CancelledError:
             return
         except Exception as e:
@@ -33,30 +38,53 @@ async def download_files(session: aiohttp.ClientSession, queue):
 
         finally:
             signal_handler.finished(unique_key)
-            queue.task_done()
+            queue.task_done(item)
 
 
-def merge_extension_filter(extensions):
-    merged_extensions = set([item.lower() for item in extensions])
-    if "video" in merged_extensions:
-        merged_extensions |= MOVIE_EXTENSIONS
-    return merged_extensions
-
-
-def is_extension_forbidden(extension, allowed_extensions, forbidden_extensions):
-    if extension is None:
-        return False
-    allowed_extensions = merge_extension_filter(allowed_extensions)
-    forbidden_extensions = merge_extension_filter(forbidden_extensions)
-
-    forbidden_extensions -= allowed_extensions
+def is_forced(absolute_path, domain, checksum, download_settings):
+    if checksum is not None:
+        return not cache.is_checksum_same(absolute_path, checksum)
+    return download_settings.force_download and domain not in FORCE_DOWNLOAD_BLACKLIST
 
-    if allowed_extensions and extension.lower() not in allowed_extensions:
-        return True
-    if extension.lower() in forbidden_extensions:
-        return True
 
-    return False
+@contextlib.asynccontextmanager
+async def open_response(session, url, session_kwargs, controller, response=None, partial=None):
+    if response is not None:
+        yield response
+        return
+    # only the transfer takes a slot of the host, checking existing files never waits
+    async with HostSlot(controller, url.host):
+        if partial is None:
+            async with session.get(url, timeout=aiohttp.ClientTimeout(total=0), **session_kwargs) as response:
+                yield response
+        else:
+            async with open_partial_response(session, url, session_kwargs, partial) as response:
+                yield response
+
+
+async def download_with_extension_lookup(session, url, session_kwargs, controller, **kwargs):
+    """
+    Decides the extension from the response of the download itself, instead of
+    an extra request. The headers are used first, then the first bytes of the body.
+    """
+    async with open_response(session, url, session_kwargs, controller) as response:
+        response.raise_for_status()
+        extension = core.utils.get_extension_from_response(response)
+        prefix = b""
+        if extension is None or extension == "bin":
+            prefix = await read_prefix(response, SNIFF_SIZE)
+            extension = core.utils.sniff_extension(prefix) or extension
+
+        cache.save_extension(str(url), extension)
+        logger.debug(f"Got extension from download, url: {url}, extension: {extension}")
+
+        await download_if_not_exist(session,
+                                    url=url,
+                                    session_kwargs=session_kwargs,
+                                    controller=controller,
+                                    response=response,
+                                    prefix=prefix,
+                                    **kwargs)
 
 
 async def download_if_not_exist(session,
@@ -66,25 +94,24 @@ async def download_if_not_exist(session,
                                 cancellable_pool,
                                 with_extension=True,
                                 session_kwargs=None,
-                                allowed_extensions=None,
-                                forbidden_extensions=None,
+                                rules=None,
                                 checksum=None,
+                                content_hashes=None,
+                                size=None,
                                 signal_handler=None,
-                                unique_key=None):
+                                unique_key=None,
+                                controller=None,
+                                response=None,
+                                prefix=b""):
+    """
+    response and prefix are only used by download_with_extension_lookup,
+    which already opened the response and read the first bytes of the body
+    """
     if session_kwargs is None:
         session_kwargs = {}
 
-    if allowed_extensions is None:
-        allowed_extensions = []
-
-    if forbidden_extensions is None:
-        forbidden_extensions = []
-
-    if download_settings.allowed_extensions is not None:
-        allowed_extensions += download_settings.allowed_extensions
-
-    if download_settings.forbidden_extensions is not None:
-        forbidden_extensions += download_settings.forbidden_extensions
+    if rules is None:
+        rules = compile_rules({}, download_settings)
 
     if isinstance(url, str):
         url = URL(url)
@@ -94,6 +121,23 @@ async def download_if_not_exist(session,
     if os.path.isabs(path):
         raise ValueError("Absolutes paths are not allowed")
 
+    if not with_extension and response is None and not cache.is_extension_known(str(url)):
+        await download_with_extension_lookup(session,
+                                             url=url,
+                                             session_kwargs=session_kwargs,
+                                             controller=controller,
+                                             path=path,
+                                             download_settings=download_settings,
+                                             cancellable_pool=cancellable_pool,
+                                             with_extension=with_extension,
+                                             rules=rules,
+                                             checksum=checksum,
+                                             content_hashes=content_hashes,
+                                             size=size,
+                                             signal_handler=signal_handler,
+                                             unique_key=unique_key)
+        return
+
     absolute_path = os.path.join(download_settings.save_path, path)
 
     if not with_extension:
@@ -102,14 +146,17 @@ async def download_if_not_exist(session,
             logger.warning(f"Could not retrieve the extension for {url}")
             return
 
+        path += "." + guess_extension
         absolute_path += "." + guess_extension
 
     file_name = os.path.basename(absolute_path)
     dir_path = os.path.dirname(absolute_path)
     file_extension = core.utils.get_extension(file_name)
 
-    temp_file_name = core.utils.add_extension(f"{random.getrandbits(64)}", file_extension)
-    temp_absolute_path = os.path.join(core.utils.get_temp_path(), temp_file_name)
+    if rules.check_path(path, file_extension) is not None:
+        return
+
+    temp_absolute_path = staging.get_temp_path(download_settings.save_path, file_extension)
 
     old_file_name = core.utils.insert_text_before_extension(file_name, "-old")
     old_absolute_path = os.path.join(dir_path, old_file_name)
@@ -117,69 +164,97 @@ async def download_if_not_exist(session,
     diff_file_name = core.utils.insert_text_before_extension(file_name, "-diff")
     diff_absolute_path = os.path.join(dir_path, diff_file_name)
 
-    force = False
-    if checksum is not None:
-        force = not cache.is_checksum_same(absolute_path, checksum)
-    elif download_settings.force_download and domain not in FORCE_DOWNLOAD_BLACKLIST:
-        force = True
+    force = is_forced(absolute_path, domain, checksum, download_settings)
+    exists = local_index.exists(absolute_path)
 
-    if os.path.exists(absolute_path) and not force:
+    if exists and force and content_hashes:
+        own_checksum = await get_own_checksum_if_content_same(absolute_path, content_hashes)
+        if own_checksum is not None:
+            logger.debug(f"Local file '{absolute_path}' matches the checksum of the server. Skipping download")
+            cache.save_own_checksum(absolute_path, own_checksum)
+            cache.save_checksum(absolute_path, checksum)
+            return
+
+    if exists and not force:
         return
 
-    if os.path.exists(absolute_path):
-        headers = session_kwargs.get("headers", {})
+    headers = dict(session_kwargs.get("headers", {}))
+
+    etag = None
+    if exists:
         etag = cache.get_etag(absolute_path)
         if etag is not None:
             headers["If-None-Match"] = etag
-        if headers:
-            session_kwargs["headers"] = headers
 
-    if os.path.exists(absolute_path):
+    if exists:
         action = ACTION_REPLACE
     else:
         action = ACTION_NEW
 
-    if is_extension_forbidden(extension=file_extension,
-                              forbidden_extensions=forbidden_extensions,
-                              allowed_extensions=allowed_extensions):
-        return
+    partial = PartialDownload(staging.get_partial_path(download_settings.save_path, absolute_path), url)
+    if download_settings.resume_downloads and response is None:
+        await asyncio.get_event_loop().run_in_executor(None, partial.load)
+    else:
+        partial.discard()
 
-    try:
+    if headers:
+        session_kwargs = {**session_kwargs, "headers": headers}
+
+    # an already open response was sent without the conditional headers
+    check_etag = response is not None and etag is not None
 
-        async with session.get(url, timeout=aiohttp.ClientTimeout(total=0), **session_kwargs) as response:
+    try:
+        async with open_response(session, url, session_kwargs, controller, response, partial) as response:
             response.raise_for_status()
             response_headers = response.headers
 
-            if response.status == 304:
+            if response.status == 304 or (check_etag and response_headers.get("ETag", None) == etag):
                 logger.debug(f"File '{absolute_path}' not modified")
+                partial.discard()
                 cache.save_checksum(absolute_path, checksum)
                 return
 
+            total_size = response.content_length
+            if total_size is not None and response.status == 206:
+                total_size += partial.bytes_written
+            if rules.is_too_large(total_size):
+                logger.info(f"Skipping {file_name}. It is larger than {rules.max_size // 1024 // 1024} MB")
+                partial.discard()
+                return
+
             if file_extension and file_extension.lower() in MOVIE_EXTENSIONS:
                 logger.info(f"Starting to download {file_name}")
 
-            pathlib.Path(os.path.dirname(absolute_path)).mkdir(parents=True, exist_ok=True)
-
-            if action == ACTION_REPLACE:
-                shutil.move(absolute_path, temp_absolute_path)
+            pathlib.Path(dir_path).mkdir(parents=True, exist_ok=True)
 
-            file_hash = hashlib.md5()
+            partial.open(response, checkpoint=download_settings.resume_downloads)
             try:
-                with open(absolute_path, 'wb') as f:
-                    while True:
-                        chunk = await response.content.read(8192)
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        file_hash.update(chunk)
+                if prefix:
+                    await partial.write(prefix)
+                if not prefix and segmented.can_segment(response, partial, download_settings):
+                    await segmented.download_segmented(session, url, response, partial, session_kwargs,
+                                                       download_settings, controller, content_hashes)
+                else:
+                    async for chunk in iter_chunks(response):
+                        await partial.write(chunk)
+                await partial.finish()
             except BaseException as e:
-                os.remove(absolute_path)
-                logger.debug(f"Removed file {absolute_path}")
-                if action == ACTION_REPLACE:
-                    logger.debug(f"Reverting temp file to new file: {absolute_path}")
-                    shutil.move(temp_absolute_path, absolute_path)
+                partial.keep_or_discard(keep=download_settings.resume_downloads)
                 raise e
 
+        if action == ACTION_REPLACE:
+            staging.stage_old_version(absolute_path, temp_absolute_path)
+
+        try:
+            partial.commit(absolute_path)
+        except BaseException as e:
+            if action == ACTION_REPLACE and not os.path.exists(absolute_path):
+                staging.move_file(temp_absolute_path, absolute_path)
+            raise e
+        finally:
+            local_index.update(absolute_path)
+        file_hash = partial.file_hash
+
         if action == ACTION_REPLACE and cache.is_own_checksum_same(absolute_path, file_hash.hexdigest()):
             logger.debug(f"own_checksum is same for {url}. Skipping processing")
             if "ETag" in response_headers:
@@ -200,9 +275,15 @@ async def download_if_not_exist(session,
                                       absolute_path=absolute_path,
                                       old_absolute_path=temp_absolute_path,
                                       out_path=diff_absolute_path)
+            local_index.update(diff_absolute_path)
 
         if action == ACTION_REPLACE and download_settings.keep_replaced_files:
-            shutil.move(temp_absolute_path, old_absolute_path)
+            staging.move_file(temp_absolute_path, old_absolute_path)
+            local_index.update(old_absolute_path)
+
+        if dedup.deduplicate(absolute_path, partial.content_hash.hexdigest(), download_settings):
+            # a link replaced the downloaded file, it has the mtime of the other copy
+            local_index.update(absolute_path)
 
         cache.save_own_checksum(absolute_path, file_hash.hexdigest())
 
@@ -215,9 +296,9 @@ async def download_if_not_exist(session,
 
         if action == ACTION_REPLACE:
             signal_old_path, signal_diff_path = None, None
-            if os.path.exists(old_absolute_path) and download_settings.keep_replaced_files:
+            if local_index.exists(old_absolute_path) and download_settings.keep_replaced_files:
                 signal_old_path = old_absolute_path
-            if os.path.exists(diff_absolute_path) and download_settings.highlight_difference:
+            if local_index.exists(diff_absolute_path) and download_settings.highlight_difference:
                 signal_diff_path = diff_absolute_path
 
             signal_handler.replaced_file(unique_key,
@@ -250,11 +331,30 @@ async def download_if_not_exist(session,
 
         logger.info(core.utils.fit_sections_to_console(start, end, margin=1))
 
+    except aiohttp.ClientResponseError as e:
+        if e.status == 416:
+            logger.debug(f"Server rejected the range for {url}. Removing partial file")
+            partial.discard()
+        raise e
+
     finally:
         if os.path.exists(temp_absolute_path):
             os.remove(temp_absolute_path)
 
 
+async def get_own_checksum_if_content_same(absolute_path, content_hashes):
+    algorithm = next((name for name in CONTENT_HASH_ALGORITHMS if content_hashes.get(name)), None)
+    if algorithm is None:
+        return None
+
+    loop = asyncio.get_event_loop()
+    hashes = await loop.run_in_executor(None, core.utils.hash_file, absolute_path, {algorithm, "md5"})
+    if hashes[algorithm] != content_hashes[algorithm].lower():
+        return None
+
+    return hashes["md5"]
+
+
 async def _add_pdf_highlights(download_settings,
                               cancellable_pool,
                               signal_handler,
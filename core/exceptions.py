@@ -12,3 +12,11 @@ class ForbiddenError(Exception):
 
 class ParseTemplateRuntimeError(Exception):
     pass
+
+
+class SegmentError(Exception):
+    pass
+
+
+class RangeMismatchError(Exception):
+    pass
@@ -0,0 +1,248 @@
+import email.utils
+import hashlib
+import logging
+import os
+import time
+import zlib
+
+from multidict import CIMultiDict
+from yarl import URL
+
+from core.response_cache import CachedResponse
+from core.storage import cache
+from core.storage.utils import get_http_cache_path
+
+logger = logging.getLogger(__name__)
+
+MAX_HTTP_CACHE_BYTES = 100 * 1024 * 1024
+STORED_HEADERS = ["Content-Type", "ETag", "Last-Modified"]
+# the key doesn't contain the cookies, so these responses can't be told apart
+UNCACHEABLE_VARY = {"*", "cookie", "authorization"}
+
+
+def parse_cache_control(value):
+    directives = {}
+    for part in value.split(","):
+        name, _, argument = part.strip().partition("=")
+        if name:
+            directives[name.lower()] = argument.strip('"')
+    return directives
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def get_freshness_lifetime(headers):
+    """Only explicit lifetimes are used, without one the response is always revalidated"""
+    directives = parse_cache_control(headers.get("Cache-Control", ""))
+    if "no-cache" in directives:
+        return 0
+    if "max-age" in directives:
+        try:
+            return int(directives["max-age"])
+        except ValueError:
+            return 0
+    if "Expires" in headers:
+        expires = parse_http_date(headers["Expires"])
+        date = parse_http_date(headers.get("Date", "")) or time.time()
+        if expires is not None:
+            return max(expires - date, 0)
+    return 0
+
+
+def is_storable(response):
+    if response.status != 200:
+        return False
+    if "no-store" in parse_cache_control(response.headers.get("Cache-Control", "")):
+        return False
+    vary = {name.strip().lower() for name in response.headers.get("Vary", "").split(",")}
+    if vary & UNCACHEABLE_VARY:
+        return False
+    # without validators and lifetime, the entry could never be used
+    return "ETag" in response.headers or \
+           "Last-Modified" in response.headers or \
+           get_freshness_lifetime(response.headers) > 0
+
+
+class HttpCache(object):
+    """
+    Keeps responses of listing pages and APIs between runs, following the
+    Cache-Control, ETag and Last-Modified headers of the server. Entries are
+    revalidated with conditional requests when they aren't fresh anymore.
+    The bodies are stored compressed, the least recently used ones are
+    removed, once all of them take more than max_bytes. Their total size is
+    kept in the http_cache_info table, so it isn't summed up every run.
+    """
+
+    def __init__(self, max_bytes=MAX_HTTP_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.fresh = 0
+        self.revalidated = 0
+        self.stored = 0
+
+    @staticmethod
+    def get_key(url, kwargs):
+        return hashlib.sha1(f"{url}|{sorted(kwargs.items())!r}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_body_path(key):
+        return os.path.join(get_http_cache_path(), key + ".z")
+
+    @staticmethod
+    def _get_size():
+        info = cache.get_json("http_cache_info")
+        if "size" not in info:
+            # caches from before the running total
+            info["size"] = sum(entry["size"] for entry in cache.get_json("http_cache").values())
+        return info["size"]
+
+    @staticmethod
+    def _set_size(size):
+        cache.get_json("http_cache_info")["size"] = size
+
+    def _remove(self, table, key):
+        size = self._get_size()
+        self._set_size(size - table.pop(key)["size"])
+        try:
+            os.remove(self.get_body_path(key))
+        except FileNotFoundError:
+            pass
+
+    def _get_entry(self, key):
+        table = cache.get_json("http_cache")
+        entry = table.get(key, None)
+        if entry is not None and not os.path.exists(self.get_body_path(key)):
+            self._remove(table, key)
+            return None
+        return entry
+
+    def _load(self, key, entry):
+        """Returns None and removes the entry, if the body can't be read"""
+        try:
+            with open(self.get_body_path(key), "rb") as f:
+                body = zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            logger.debug(f"Could not load the cached response of {entry['url']}. {type(e).__name__}: {e}")
+            self._remove(cache.get_json("http_cache"), key)
+            return None
+
+        entry["last_used"] = time.time()
+        cache.get_json("http_cache").mark_dirty(key)
+        return CachedResponse(url=URL(entry["url"]),
+                              status=200,
+                              headers=CIMultiDict(entry["headers"]),
+                              body=body,
+                              encoding=entry["encoding"])
+
+    async def get(self, session, url, **kwargs):
+        key = self.get_key(url, kwargs)
+        entry = self._get_entry(key)
+
+        if entry is not None and time.time() - entry["stored_at"] < entry["lifetime"]:
+            result = self._load(key, entry)
+            if result is not None:
+                self.fresh += 1
+                return result
+            entry = None
+
+        request_kwargs = kwargs
+        if entry is not None:
+            headers = dict(kwargs.get("headers", None) or {})
+            if entry["headers"].get("ETag", None) is not None:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if entry["headers"].get("Last-Modified", None) is not None:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+            request_kwargs = {**kwargs, "headers": headers}
+
+        async with session.get(url, **request_kwargs) as response:
+            if response.status == 304 and entry is not None:
+                entry["stored_at"] = time.time() - self._get_age(response)
+                entry["lifetime"] = get_freshness_lifetime(response.headers)
+                result = self._load(key, entry)
+                if result is not None:
+                    self.revalidated += 1
+                    return result
+            else:
+                body = await response.read()
+                result = CachedResponse(url=response.url,
+                                        status=response.status,
+                                        headers=response.headers,
+                                        body=body,
+                                        encoding=response.get_encoding())
+                if is_storable(response):
+                    self._store(key, response, result)
+                return result
+
+        # the body of the revalidated entry couldn't be read and the entry was removed,
+        # so this time the request isn't conditional
+        return await self.get(session, url, **kwargs)
+
+    @staticmethod
+    def _get_age(response):
+        try:
+            return int(response.headers.get("Age", 0))
+        except ValueError:
+            return 0
+
+    def _store(self, key, response, result):
+        if cache.is_dry_run():
+            # the entry would be dropped at the end of the run, but not the body
+            return
+        data = zlib.compress(result.body)
+        body_path = self.get_body_path(key)
+        # an interrupted write must not leave a truncated body behind
+        temp_body_path = body_path + ".tmp"
+        with open(temp_body_path, "wb") as f:
+            f.write(data)
+        os.replace(temp_body_path, body_path)
+
+        table = cache.get_json("http_cache")
+        size = self._get_size()
+        if key in table:
+            size -= table[key]["size"]
+
+        table[key] = {
+            "url": str(result.url),
+            "headers": {name: response.headers[name] for name in STORED_HEADERS if name in response.headers},
+            "encoding": result.encoding,
+            "stored_at": time.time() - self._get_age(response),
+            "lifetime": get_freshness_lifetime(response.headers),
+            "last_used": time.time(),
+            "size": len(data),
+        }
+        self._set_size(size + len(data))
+        self.stored += 1
+        self._evict(table)
+
+    def _evict(self, table):
+        if self._get_size() <= self.max_bytes:
+            return
+        for key in sorted(table, key=lambda k: table[k]["last_used"]):
+            if self._get_size() <= self.max_bytes:
+                break
+            self._remove(table, key)
+
+    def log_stats(self):
+        if self.fresh or self.revalidated or self.stored:
+            logger.debug(f"HTTP cache: {self.fresh} fresh, {self.revalidated} revalidated "
+                         f"and {self.stored} stored response(s)")
+
+
+def collect_http_cache():
+    """Removes the bodies without an entry, like the ones of a run, which was never committed"""
+    known_files = {os.path.basename(HttpCache.get_body_path(key)) for key in cache.get_json("http_cache")}
+    removed = 0
+    for file_name in os.listdir(get_http_cache_path()):
+        if file_name not in known_files:
+            try:
+                os.remove(os.path.join(get_http_cache_path(), file_name))
+                removed += 1
+            except OSError as e:
+                logger.warning(f"Could not remove cached response {file_name}. {type(e).__name__}: {e}")
+
+    if removed:
+        logger.debug(f"Removed {removed} cached response(s) without an entry")
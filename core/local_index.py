@@ -0,0 +1,227 @@
+import logging
+import os
+import tempfile
+import time
+
+from core import staging
+from core.constants import STAGING_FOLDER_NAME
+from core.storage import cache
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 2
+# a directory changed this close to the scan could change again with the same mtime
+RACY_MTIME_NS = 2 * 10 ** 9
+
+_root = None
+_dirs = None
+_case_insensitive = False
+
+
+def _key(name):
+    name = os.path.normcase(name)
+    if _case_insensitive:
+        return name.casefold()
+    return name
+
+
+def _is_case_insensitive(save_path):
+    """normcase only knows about windows, macOS is case-insensitive by default too"""
+    try:
+        fd, probe_path = tempfile.mkstemp(prefix="case-probe-", dir=staging.get_staging_path(save_path))
+    except OSError as e:
+        logger.debug(f"Could not check if {save_path} is case-insensitive. {type(e).__name__}: {e}")
+        return False
+    os.close(fd)
+    try:
+        head, name = os.path.split(probe_path)
+        return os.path.exists(os.path.join(head, name.upper()))
+    finally:
+        os.remove(probe_path)
+
+
+def _scan_dir(absolute_dir):
+    files = {}
+    dirs = {}
+    with os.scandir(absolute_dir) as entries:
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=True):
+                    if entry.name != STAGING_FOLDER_NAME:
+                        dirs[_key(entry.name)] = entry.name
+                else:
+                    stat = entry.stat(follow_symlinks=True)
+                    files[_key(entry.name)] = [stat.st_size, stat.st_mtime_ns, entry.name]
+            except OSError as e:
+                logger.debug(f"Could not index {entry.path}. {type(e).__name__}: {e}")
+    return files, dirs
+
+
+def _get_mtime(stat, scan_time_ns):
+    if scan_time_ns - stat.st_mtime_ns < RACY_MTIME_NS:
+        return None
+    return stat.st_mtime_ns
+
+
+def build(save_path):
+    """
+    Indexes save_path with one scandir per directory. Directories with the
+    same mtime as in the last snapshot are taken from it without a stat of
+    their files, their names didn't change. The sizes of files, which were
+    changed in place, are only refreshed by get_size. The snapshot has one
+    row per directory, so only the changed directories are written again.
+    """
+    global _root, _dirs, _case_insensitive
+
+    start_time = time.time()
+    _case_insensitive = _is_case_insensitive(save_path)
+    info = cache.get_json("local_index")
+    rows = cache.get_json("local_index_dirs")
+    if info.get("version") == INDEX_VERSION and info.get("root") == save_path and \
+            info.get("case_insensitive") == _case_insensitive:
+        old_dirs = dict(rows.iter_items())
+    else:
+        old_dirs = {}
+        for key in list(info):
+            del info[key]
+        for key in list(rows):
+            del rows[key]
+        info.update({"version": INDEX_VERSION, "root": save_path, "case_insensitive": _case_insensitive})
+
+    dirs = {}
+    visited = set()
+    num_scanned = 0
+    stack = [("", "")]
+    while stack:
+        relative_dir, real_dir = stack.pop()
+        absolute_dir = os.path.join(save_path, real_dir)
+        scan_time_ns = time.time_ns()
+        try:
+            stat = os.stat(absolute_dir)
+        except OSError:
+            continue
+        # symlinks can form loops
+        if (stat.st_dev, stat.st_ino) in visited:
+            continue
+        visited.add((stat.st_dev, stat.st_ino))
+
+        entry = old_dirs.pop(relative_dir, None)
+        if entry is None or entry["mtime"] != stat.st_mtime_ns:
+            try:
+                files, sub_dirs = _scan_dir(absolute_dir)
+            except OSError as e:
+                logger.debug(f"Could not index {absolute_dir}. {type(e).__name__}: {e}")
+                continue
+            entry = {"mtime": _get_mtime(stat, scan_time_ns), "files": files, "dirs": sub_dirs}
+            rows[relative_dir] = entry
+            num_scanned += 1
+
+        dirs[relative_dir] = entry
+        for key, name in entry["dirs"].items():
+            stack.append((os.path.join(relative_dir, key), os.path.join(real_dir, name)))
+
+    # directories, which don't exist anymore
+    for relative_dir in old_dirs:
+        del rows[relative_dir]
+
+    _root = save_path
+    _dirs = dirs
+
+    num_files = sum(len(entry["files"]) for entry in dirs.values())
+    logger.debug(f"Indexed {num_files} local files in {len(dirs)} directories. "
+                 f"Scanned {num_scanned} directories in {time.time() - start_time:.2f} seconds")
+
+
+def _get_relative_path(path):
+    if _dirs is None:
+        return None
+    try:
+        relative_path = os.path.relpath(path, _root)
+    except ValueError:
+        # different drive
+        return None
+    if relative_path == os.curdir or relative_path == os.pardir or relative_path.startswith(os.pardir + os.sep):
+        return None
+    return relative_path
+
+
+def _split(path):
+    """Returns the directory and the name relative to the root, or None if the path isn't indexed"""
+    relative_path = _get_relative_path(path)
+    if relative_path is None:
+        return None
+    return os.path.split(_key(relative_path))
+
+
+def exists(path):
+    split = _split(path)
+    if split is None:
+        return os.path.exists(path)
+    relative_dir, name = split
+    entry = _dirs.get(relative_dir, None)
+    return entry is not None and (name in entry["files"] or name in entry["dirs"])
+
+
+def get_size(path):
+    """
+    Returns the size of the file or None, if it doesn't exist. The file is
+    checked again, it could have been changed in place since its directory was indexed
+    """
+    split = _split(path)
+    if split is None:
+        return os.path.getsize(path) if os.path.isfile(path) else None
+    relative_dir, name = split
+    entry = _dirs.get(relative_dir, None)
+    if entry is None or name not in entry["files"]:
+        return None
+
+    size, mtime_ns, real_name = entry["files"][name]
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    if stat.st_size != size or stat.st_mtime_ns != mtime_ns:
+        entry["files"][name] = [stat.st_size, stat.st_mtime_ns, real_name]
+        cache.get_json("local_index_dirs").mark_dirty(relative_dir)
+    return stat.st_size
+
+
+def listdir(path):
+    """Returns the names in the directory, or an empty list if it doesn't exist"""
+    split = _split(path)
+    if split is None:
+        return os.listdir(path) if os.path.isdir(path) else []
+    entry = _dirs.get(os.path.join(*split), None)
+    if entry is None:
+        return []
+    return [file[2] for file in entry["files"].values()] + list(entry["dirs"].values())
+
+
+def update(path):
+    """Has to be called after a file in the save path was written, moved or removed"""
+    relative_path = _get_relative_path(path)
+    if relative_path is None:
+        return
+    relative_dir, name = os.path.split(relative_path)
+
+    try:
+        stat = os.stat(path)
+    except OSError:
+        entry = _dirs.get(_key(relative_dir), None)
+        if entry is not None:
+            entry["files"].pop(_key(name), None)
+        return
+
+    entry = _add_dir(relative_dir)
+    entry["files"][_key(name)] = [stat.st_size, stat.st_mtime_ns, name]
+
+
+def _add_dir(relative_dir):
+    key = _key(relative_dir)
+    if key not in _dirs:
+        # the mtime is unknown, the next build scans the directory again
+        _dirs[key] = {"mtime": None, "files": {}, "dirs": {}}
+        if relative_dir:
+            parent, name = os.path.split(relative_dir)
+            _add_dir(parent)["dirs"][_key(name)] = name
+    return _dirs[key]
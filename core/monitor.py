@@ -1,8 +1,14 @@
 import asyncio
 import logging
+import time
 
 import aiohttp.client_exceptions
 from tenacity import retry, stop_after_attempt, retry_if_exception_type, wait_fixed
+from yarl import URL
+
+from core.crawler import Crawler
+from core.http_cache import HttpCache
+from core.response_cache import ResponseCache, CachedRequestContextManager
 
 logger = logging.getLogger(__name__)
 
@@ -17,9 +23,24 @@ def after_log():
 
 
 class MonitorSession(aiohttp.ClientSession):
-    def __init__(self, signals, *args, **kwargs):
+    def __init__(self, signals, *args, controller=None, limiter=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.signals = signals
+        self.controller = controller
+        self.limiter = limiter
+        self.response_cache = ResponseCache(http_cache=HttpCache())
+        self.crawler = Crawler()
+
+    def get_cached(self, url, persistent=False, **kwargs):
+        """
+        GET for pages, which are requested multiple times per run. Only the first call
+        makes the request, the others get the same CachedResponse. With persistent,
+        the response is also kept between runs, if the headers of the server allow it
+        """
+        return CachedRequestContextManager(self.response_cache.get(self, url, persistent=persistent, **kwargs))
+
+    async def single_flight(self, key, func):
+        return await self.response_cache.single_flight(key, func)
 
     @retry(reraise=True,
            wait=wait_fixed(1),
@@ -28,20 +49,42 @@ class MonitorSession(aiohttp.ClientSession):
            retry=retry_if_exception_type((asyncio.TimeoutError,
                                           aiohttp.client_exceptions.ServerDisconnectedError,
                                           aiohttp.client_exceptions.ClientPayloadError)))
-    async def _request(self, *args, **kwargs):
-        response = await super()._request(*args, **kwargs)
+    async def _request(self, method, str_or_url, *args, **kwargs):
+        host = URL(str_or_url).host
+        start = time.monotonic()
+        try:
+            response = await super()._request(method, str_or_url, *args, **kwargs)
+        except aiohttp.ClientResponseError as e:
+            if self.controller is not None:
+                self.controller.record_response(host, time.monotonic() - start, e.status)
+            raise e
+        except (asyncio.TimeoutError, aiohttp.ClientError) as e:
+            if self.controller is not None:
+                self.controller.record_error(host, e)
+            raise e
+
+        if self.controller is not None:
+            self.controller.record_response(host, time.monotonic() - start, response.status)
         headers_length = sum((len(key) + len(value) for key, value in response.raw_headers))
         if self.signals is not None:
             self.signals.downloaded_content_length.emit(headers_length)
-        response.content.read = async_monitor_length_bytes(response.content.read, signals=self.signals)
+        response.content.read = async_monitor_length_bytes(response.content.read,
+                                                           signals=self.signals,
+                                                           controller=self.controller,
+                                                           limiter=self.limiter,
+                                                           host=host)
         return response
 
 
-def async_monitor_length_bytes(func, signals):
+def async_monitor_length_bytes(func, signals, controller=None, limiter=None, host=None):
     async def wrapper(*args, **kwargs):
         result = await func(*args, **kwargs)
         if signals is not None:
             signals.downloaded_content_length.emit(len(result))
+        if controller is not None:
+            controller.record_bytes(host, len(result))
+        if limiter is not None:
+            await limiter.consume(host, len(result))
         return result
 
     return wrapper
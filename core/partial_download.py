@@ -0,0 +1,271 @@
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import re
+
+import aiohttp
+
+from core import staging
+from core.constants import CONTENT_HASH_ALGORITHMS
+from core.exceptions import RangeMismatchError
+from core.sink import create_sink, preallocate
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_BYTES = 16 * 1024 * 1024
+HASH_READ_SIZE = 1024 * 1024
+
+
+@contextlib.asynccontextmanager
+async def open_partial_response(session, url, session_kwargs, partial):
+    """
+    Requests the part of the file, which isn't downloaded yet. If the server answers
+    with another range, the part file is dropped and the whole file requested again
+    """
+    headers = dict(session_kwargs.get("headers", {}))
+    headers.update(partial.get_range_headers())
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=0),
+                           **{**session_kwargs, "headers": headers}) as response:
+        if partial.matches_range(response):
+            yield response
+            return
+
+    logger.debug(f"Server returned an unexpected range for {url}. Restarting download")
+    partial.discard()
+    headers.pop("Range", None)
+    headers.pop("If-Range", None)
+    async with session.get(url, timeout=aiohttp.ClientTimeout(total=0),
+                           **{**session_kwargs, "headers": headers}) as response:
+        yield response
+
+
+class PartialDownload(object):
+    """
+    Holds the bytes of an unfinished download in a '.part' file in the staging
+    folder and the state needed to continue it in a sidecar json file.
+    The md5 state can't be serialized, so it is rebuilt from the part file
+    and compared against the digest stored in the sidecar.
+    """
+
+    def __init__(self, path, url):
+        self.path = path
+        self.meta_path = self.path + ".json"
+        self.url = str(url)
+        self.etag = None
+        self.last_modified = None
+        self.accept_ranges = False
+        self.file = None
+        self.sink = None
+        self.checkpoint = False
+        self._reset()
+
+    def _reset(self):
+        self.bytes_written = 0
+        self.file_hash = hashlib.md5()
+        self.content_hash = hashlib.sha256()
+        self._checkpoint_at = CHECKPOINT_BYTES
+
+    def load(self):
+        """Reads the whole part file to rebuild the hashes, so it should run in an executor"""
+        if not os.path.exists(self.meta_path) or not os.path.exists(self.path):
+            self.discard()
+            return 0
+
+        try:
+            with open(self.meta_path, "r") as f:
+                meta = json.load(f)
+            bytes_written = int(meta["bytes_written"])
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            logger.debug(f"Could not read partial meta data {self.meta_path}. {type(e).__name__}: {e}")
+            self.discard()
+            return 0
+
+        if meta.get("url") != self.url or os.path.getsize(self.path) < bytes_written:
+            self.discard()
+            return 0
+
+        file_hash = hashlib.md5()
+        content_hash = hashlib.sha256()
+        with open(self.path, "r+b") as f:
+            f.truncate(bytes_written)
+            while True:
+                chunk = f.read(HASH_READ_SIZE)
+                if not chunk:
+                    break
+                file_hash.update(chunk)
+                content_hash.update(chunk)
+
+        if file_hash.hexdigest() != meta.get("md5"):
+            logger.debug(f"Partial file {self.path} does not match its meta data")
+            self.discard()
+            return 0
+
+        self.etag = meta.get("etag", None)
+        self.last_modified = meta.get("last_modified", None)
+        self.accept_ranges = True
+        self.bytes_written = bytes_written
+        self.file_hash = file_hash
+        self.content_hash = content_hash
+        self._checkpoint_at = bytes_written + CHECKPOINT_BYTES
+        return bytes_written
+
+    def get_validator(self):
+        if self.etag is not None:
+            return self.etag
+        return self.last_modified
+
+    def is_resumable(self):
+        return self.accept_ranges and self.get_validator() is not None
+
+    def get_range_headers(self):
+        if not self.bytes_written or not self.is_resumable():
+            return {}
+        return {
+            "Range": f"bytes={self.bytes_written}-",
+            "If-Range": self.get_validator(),
+        }
+
+    def matches_range(self, response):
+        """A partial response has to continue exactly where the part file ends"""
+        return response.status != 206 or self._get_range_start(response) == self.bytes_written
+
+    def open(self, response, checkpoint=False):
+        if not self.matches_range(response):
+            raise RangeMismatchError(f"Server returned the range {response.headers.get('Content-Range')} "
+                                     f"for {self.url}, but {self.bytes_written} bytes are downloaded")
+
+        resume = response.status == 206 and self.bytes_written > 0
+        if resume:
+            logger.debug(f"Resuming download of {self.url} at byte {self.bytes_written}")
+        else:
+            self._reset()
+            self.accept_ranges = response.headers.get("Accept-Ranges", "").lower() == "bytes"
+
+        self.etag = response.headers.get("ETag", None)
+        self.last_modified = response.headers.get("Last-Modified", None)
+        if self.etag is not None and self.etag.startswith("W/"):
+            # weak validators are not allowed in If-Range
+            self.etag = None
+
+        self.file = open(self.path, "r+b" if resume else "wb")
+        if resume:
+            self.file.seek(self.bytes_written)
+            self.file.truncate()
+
+        preallocate(self.file, response.content_length)
+        self.checkpoint = checkpoint
+        self.sink = create_sink(self.file, response.content_length, on_write=self._on_write)
+
+    @staticmethod
+    def _get_range_start(response):
+        content_range = response.headers.get("Content-Range", "")
+        match = re.match(r"bytes (\d+)-", content_range)
+        if match is None:
+            return None
+        return int(match.group(1))
+
+    async def write(self, chunk):
+        await self.sink.write(chunk)
+
+    def _on_write(self, chunk):
+        # may be called from the writer thread of the sink
+        self.file_hash.update(chunk)
+        self.content_hash.update(chunk)
+        self.bytes_written += len(chunk)
+        if self.checkpoint and self.bytes_written >= self._checkpoint_at:
+            self.save()
+            self._checkpoint_at = self.bytes_written + CHECKPOINT_BYTES
+
+    async def finish(self):
+        if self.sink is not None:
+            await self.sink.close()
+            self.sink = None
+        self.close()
+
+    def extend_hash(self, size):
+        """Hashes bytes that were written behind the prefix by someone else"""
+        if self.file is not None:
+            self.file.flush()
+        with open(self.path, "rb") as f:
+            f.seek(self.bytes_written)
+            while self.bytes_written < size:
+                chunk = f.read(min(HASH_READ_SIZE, size - self.bytes_written))
+                if not chunk:
+                    raise ValueError(f"Partial file {self.path} is smaller than {size} bytes")
+                self.file_hash.update(chunk)
+                self.content_hash.update(chunk)
+                self.bytes_written += len(chunk)
+
+    def matches_content_hashes(self, content_hashes):
+        """
+        Compares the downloaded bytes with the hashes of the server. The md5 and sha256
+        are already known, others read the file again, so it should run in an executor
+        """
+        if not content_hashes:
+            return True
+        known_hashes = {"md5": self.file_hash, "sha256": self.content_hash}
+        algorithms = [name for name in CONTENT_HASH_ALGORITHMS if content_hashes.get(name)]
+        if not algorithms:
+            return True
+        algorithm = next((name for name in algorithms if name in known_hashes), algorithms[0])
+
+        if algorithm in known_hashes:
+            digest = known_hashes[algorithm].hexdigest()
+        else:
+            file_hash = hashlib.new(algorithm)
+            with open(self.path, "rb") as f:
+                while True:
+                    chunk = f.read(HASH_READ_SIZE)
+                    if not chunk:
+                        break
+                    file_hash.update(chunk)
+            digest = file_hash.hexdigest()
+        return digest == content_hashes[algorithm].lower()
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.abort()
+            self.sink = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def save(self):
+        if self.file is not None:
+            self.file.flush()
+        meta = {
+            "url": self.url,
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "bytes_written": self.bytes_written,
+            "md5": self.file_hash.hexdigest(),
+        }
+        temp_meta_path = self.meta_path + ".tmp"
+        with open(temp_meta_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(temp_meta_path, self.meta_path)
+
+    def keep_or_discard(self, keep):
+        self.close()
+        if keep and self.is_resumable() and self.bytes_written:
+            self.save()
+            logger.debug(f"Kept {self.bytes_written} bytes of {self.url} in {self.path}")
+        else:
+            self.discard()
+
+    def discard(self):
+        self.close()
+        self._reset()
+        for path in [self.path, self.meta_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def commit(self, absolute_path):
+        self.close()
+        if os.path.getsize(self.path) > self.bytes_written:
+            os.truncate(self.path, self.bytes_written)
+        staging.move_file(self.path, absolute_path)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
@@ -0,0 +1,224 @@
+import asyncio
+import collections
+import datetime
+import json
+import logging
+import os
+
+import aiohttp
+from aiohttp.client import URL
+
+import core.utils
+from core import downloader, local_index
+from core.concurrency import HostSlot
+from core.constants import VERSION
+from core.rules import compile_rules
+from core.storage import cache
+from core.storage.policy import set_owner
+
+logger = logging.getLogger(__name__)
+
+PLAN_VERSION = 1
+
+PLAN_NEW = "new"
+PLAN_REPLACE = "replace"
+PLAN_REVALIDATE = "revalidate"
+PLAN_EXTENSION_LOOKUP = "extension lookup"
+
+SKIP_EXISTS = "exists"
+SKIP_SAME_CONTENT = "same content"
+SKIP_FILTERED = "filtered"
+SKIP_NO_EXTENSION = "no extension"
+SKIP_ERROR = "error"
+
+SIZE_LISTING = "listing"
+SIZE_LOCAL = "local"
+SIZE_HEAD = "head"
+
+
+class Plan(object):
+    """
+    Collects what a run would transfer. 'revalidate' files are only
+    downloaded, if the server has a newer version than the saved ETag.
+    """
+
+    def __init__(self, download_settings):
+        self.save_path = download_settings.save_path
+        self.files = []
+        self.skipped = collections.Counter()
+
+    def add(self, unique_key, path, url, action, size, size_source):
+        self.files.append({
+            "unique_key": unique_key,
+            "path": path,
+            "url": str(url),
+            "host": url.host,
+            "action": action,
+            "size": size,
+            "size_source": size_source,
+        })
+
+    def skip(self, reason):
+        self.skipped[reason] += 1
+
+    def get_sites(self):
+        sites = {}
+        for file in self.files:
+            if file["unique_key"] not in sites:
+                sites[file["unique_key"]] = {
+                    PLAN_NEW: 0,
+                    PLAN_REPLACE: 0,
+                    PLAN_REVALIDATE: 0,
+                    PLAN_EXTENSION_LOOKUP: 0,
+                    "bytes": 0,
+                    "unknown_sizes": 0,
+                }
+            site = sites[file["unique_key"]]
+            site[file["action"]] += 1
+            if file["size"] is None:
+                site["unknown_sizes"] += 1
+            else:
+                site["bytes"] += file["size"]
+        return sites
+
+    def to_dict(self):
+        sites = self.get_sites()
+        return {
+            "version": PLAN_VERSION,
+            "app_version": VERSION,
+            "created": datetime.datetime.now().isoformat(timespec="seconds"),
+            "save_path": self.save_path,
+            "total": {
+                "files": len(self.files),
+                "bytes": sum(site["bytes"] for site in sites.values()),
+                "unknown_sizes": sum(site["unknown_sizes"] for site in sites.values()),
+                "skipped": dict(self.skipped),
+            },
+            "sites": sites,
+            "files": self.files,
+        }
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def log_summary(self):
+        total = self.to_dict()["total"]
+        actions = collections.Counter(file["action"] for file in self.files)
+        logger.info(f"Plan: {actions[PLAN_NEW]} new, {actions[PLAN_REPLACE]} replaced, "
+                    f"{actions[PLAN_REVALIDATE]} revalidated and {actions[PLAN_EXTENSION_LOOKUP]} "
+                    f"unknown file(s) with {total['bytes'] / 1024 / 1024:.1f} MB "
+                    f"and {total['unknown_sizes']} unknown size(s)")
+
+
+def get_plan_path():
+    plans_path = os.path.join(core.utils.get_app_data_path(), "plans")
+    os.makedirs(plans_path, exist_ok=True)
+    return os.path.join(plans_path, datetime.datetime.now().strftime("%Y-%m-%d %H-%M-%S") + ".json")
+
+
+async def plan_files(session, queue, plan, controller=None):
+    while True:
+        item = await queue.get()
+        unique_key = item["unique_key"]
+        signal_handler = item["signal_handler"]
+        set_owner(item.pop("owner", None))
+        try:
+            await plan_file(session, plan, controller=controller, **item)
+        except asyncio.CancelledError:
+            return
+        except Exception as e:
+            logger.error(f"Planner got an unexpected error: {type(e).__name__}: {e}", exc_info=True)
+            plan.skip(SKIP_ERROR)
+        finally:
+            signal_handler.finished(unique_key)
+            queue.task_done(item)
+
+
+async def get_head_size(session, url, session_kwargs, controller):
+    try:
+        async with HostSlot(controller, url.host), session.head(url, allow_redirects=True,
+                                                                 **session_kwargs) as response:
+            return response.content_length
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.debug(f"Could not get the size of {url}. {type(e).__name__}: {e}")
+        return None
+
+
+async def plan_file(session,
+                    plan,
+                    path,
+                    url,
+                    download_settings,
+                    with_extension=True,
+                    session_kwargs=None,
+                    rules=None,
+                    checksum=None,
+                    content_hashes=None,
+                    size=None,
+                    signal_handler=None,
+                    unique_key=None,
+                    cancellable_pool=None,
+                    controller=None):
+    """Makes the same decisions as downloader.download_if_not_exist without transferring the files"""
+    if session_kwargs is None:
+        session_kwargs = {}
+
+    if rules is None:
+        rules = compile_rules({}, download_settings)
+
+    if isinstance(url, str):
+        url = URL(url)
+
+    absolute_path = os.path.join(download_settings.save_path, path)
+
+    if not with_extension:
+        extension = cache.lookup_extension(str(url))
+        if extension is cache.MISSING:
+            # the extension is only known after a request to the file
+            plan.add(unique_key, path, url, PLAN_EXTENSION_LOOKUP, size, SIZE_LISTING if size else None)
+            return
+        if extension is None:
+            plan.skip(SKIP_NO_EXTENSION)
+            return
+        absolute_path += "." + extension
+
+    file_extension = core.utils.get_extension(os.path.basename(absolute_path))
+    relative_path = os.path.relpath(absolute_path, download_settings.save_path)
+
+    if rules.check_path(relative_path, file_extension) is not None:
+        plan.skip(SKIP_FILTERED)
+        return
+
+    force = downloader.is_forced(absolute_path, url.host, checksum, download_settings)
+    exists = local_index.exists(absolute_path)
+
+    if exists and force and content_hashes:
+        if await downloader.get_own_checksum_if_content_same(absolute_path, content_hashes) is not None:
+            plan.skip(SKIP_SAME_CONTENT)
+            return
+
+    if exists and not force:
+        plan.skip(SKIP_EXISTS)
+        return
+
+    if not exists:
+        action = PLAN_NEW
+    elif cache.get_etag(absolute_path) is not None:
+        action = PLAN_REVALIDATE
+    else:
+        action = PLAN_REPLACE
+
+    if size is not None:
+        size_source = SIZE_LISTING
+    elif exists:
+        size, size_source = local_index.get_size(absolute_path), SIZE_LOCAL
+    else:
+        size = await get_head_size(session, url, session_kwargs, controller)
+        size_source = SIZE_HEAD if size is not None else None
+
+    if rules.is_too_large(size):
+        plan.skip(SKIP_FILTERED)
+        return
+
+    plan.add(unique_key, relative_path, url, action, size, size_source)
@@ -0,0 +1,140 @@
+import asyncio
+import collections
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+MAX_CACHE_BYTES = 64 * 1024 * 1024
+MAX_BODY_BYTES = 8 * 1024 * 1024
+
+
+class CachedResponse(object):
+    """The part of aiohttp.ClientResponse the producers use, with the body already read"""
+
+    def __init__(self, url, status, headers, body, encoding):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.encoding = encoding
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    async def read(self):
+        return self.body
+
+    async def text(self, encoding=None, errors="strict"):
+        return self.body.decode(encoding or self.encoding, errors=errors)
+
+    async def json(self, loads=json.loads, **kwargs):
+        return loads(await self.text())
+
+
+class ResponseCache(object):
+    """
+    Coalesces identical requests, which are in flight at the same time, and keeps
+    the bodies of successful GETs for the rest of the run. Only the least recently
+    used responses are dropped, once the bodies take more than max_bytes.
+    """
+
+    def __init__(self, max_bytes=MAX_CACHE_BYTES, http_cache=None):
+        self.max_bytes = max_bytes
+        self.http_cache = http_cache
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.in_flight = {}
+        self.hits = 0
+        self.coalesced = 0
+        self.misses = 0
+
+    async def single_flight(self, key, func):
+        """Awaits func() once for all callers with the same key, which arrive while it runs"""
+        while key in self.in_flight:
+            future = self.in_flight[key]
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the caller, which made the request, was cancelled. Try again
+
+        future = asyncio.get_event_loop().create_future()
+        self.in_flight[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError as e:
+            future.cancel()
+            raise e
+        except BaseException as e:
+            future.set_exception(e)
+            # mark as retrieved, if nobody else was waiting
+            future.exception()
+            raise e
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self.in_flight[key]
+
+    async def get(self, session, url, persistent=False, **kwargs):
+        key = (str(url), repr(sorted(kwargs.items())))
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return self.entries[key]
+
+        async def request():
+            self.misses += 1
+            if persistent and self.http_cache is not None:
+                return await self.http_cache.get(session, url, **kwargs)
+            async with session.get(url, **kwargs) as response:
+                body = await response.read()
+                return CachedResponse(url=response.url,
+                                      status=response.status,
+                                      headers=response.headers,
+                                      body=body,
+                                      encoding=response.get_encoding())
+
+        response = await self.single_flight(key, request)
+        if key not in self.entries and len(response.body) <= MAX_BODY_BYTES:
+            self._add(key, response)
+        return response
+
+    def _add(self, key, response):
+        self.entries[key] = response
+        self.size += len(response.body)
+        while self.size > self.max_bytes:
+            _, old_response = self.entries.popitem(last=False)
+            self.size -= len(old_response.body)
+
+    def log_stats(self):
+        if self.hits or self.coalesced:
+            logger.debug(f"Response cache: {self.misses} request(s), {self.hits} hit(s) "
+                         f"and {self.coalesced} coalesced request(s)")
+        if self.http_cache is not None:
+            self.http_cache.log_stats()
+
+
+class CachedRequestContextManager(object):
+    """Allows 'async with session.get_cached(url) as response', like session.get"""
+
+    def __init__(self, coroutine):
+        self._coroutine = coroutine
+
+    def __await__(self):
+        return self._coroutine.__await__()
+
+    async def __aenter__(self):
+        return await self._coroutine
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        pass
@@ -0,0 +1,115 @@
+import fnmatch
+import logging
+import re
+
+import core.utils
+from core.constants import MOVIE_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+REGEX_PREFIX = "re:"
+
+REJECT_EXTENSION = "extension"
+REJECT_INCLUDE = "not included"
+REJECT_EXCLUDE = "excluded"
+REJECT_SIZE = "too large"
+
+
+def merge_extension_filter(extensions):
+    merged_extensions = set([item.lower() for item in extensions])
+    if "video" in merged_extensions:
+        merged_extensions |= MOVIE_EXTENSIONS
+    return merged_extensions
+
+
+def compile_patterns(patterns):
+    """
+    Returns one regex for the file name and one for the whole path. Patterns
+    with a '/' are globs for the path, 're:' starts a regex for the path and
+    everything else is a glob for the file name.
+    """
+    name_parts = []
+    path_parts = []
+    for pattern in patterns:
+        if pattern.startswith(REGEX_PREFIX):
+            path_parts.append(f"(?:{pattern[len(REGEX_PREFIX):]})")
+        elif "/" in pattern:
+            path_parts.append(fnmatch.translate(pattern))
+        else:
+            name_parts.append(fnmatch.translate(pattern))
+
+    name_regex = re.compile("|".join(name_parts), re.IGNORECASE) if name_parts else None
+    path_regex = re.compile("|".join(path_parts), re.IGNORECASE) if path_parts else None
+    return name_regex, path_regex
+
+
+class Rules(object):
+    def __init__(self,
+                 allowed_extensions=None,
+                 forbidden_extensions=None,
+                 include_patterns=None,
+                 exclude_patterns=None,
+                 max_size=None):
+        self.allowed_extensions = merge_extension_filter(allowed_extensions or [])
+        self.forbidden_extensions = merge_extension_filter(forbidden_extensions or []) - self.allowed_extensions
+        self.include = compile_patterns(include_patterns or [])
+        self.exclude = compile_patterns(exclude_patterns or [])
+        self.has_include = bool(include_patterns)
+        self.max_size = max_size
+
+    def is_extension_forbidden(self, extension):
+        if extension is None:
+            return False
+        if self.allowed_extensions and extension.lower() not in self.allowed_extensions:
+            return True
+        if extension.lower() in self.forbidden_extensions:
+            return True
+        return False
+
+    @staticmethod
+    def _matches(compiled, path):
+        name_regex, path_regex = compiled
+        path = path.replace("\\", "/")
+        if name_regex is not None and name_regex.match(path.rpartition("/")[2]):
+            return True
+        if path_regex is not None and path_regex.search(path):
+            return True
+        return False
+
+    def is_too_large(self, size):
+        return self.max_size is not None and size is not None and size > self.max_size
+
+    def check_path(self, path, extension):
+        if self.is_extension_forbidden(extension):
+            return REJECT_EXTENSION
+        if self.has_include and not self._matches(self.include, path):
+            return REJECT_INCLUDE
+        if self._matches(self.exclude, path):
+            return REJECT_EXCLUDE
+        return None
+
+    def check_item(self, item):
+        """Returns why the item is rejected or None"""
+        if self.is_too_large(item.get("size", None)):
+            return REJECT_SIZE
+        # without extension, the path is only complete after the lookup in the downloader
+        if not item.get("with_extension", True):
+            return None
+        path = item["path"]
+        return self.check_path(path, core.utils.get_extension(path.replace("\\", "/").rpartition("/")[2]))
+
+
+def compile_rules(consumer_kwargs, download_settings):
+    allowed_extensions = (consumer_kwargs.get("allowed_extensions") or []) + \
+                         (download_settings.allowed_extensions or [])
+    forbidden_extensions = (consumer_kwargs.get("forbidden_extensions") or []) + \
+                           (download_settings.forbidden_extensions or [])
+
+    max_sizes = [size for size in [consumer_kwargs.get("max_size"), download_settings.max_file_size] if size]
+    max_size = min(max_sizes) * 1024 * 1024 if max_sizes else None
+
+    return Rules(allowed_extensions=allowed_extensions,
+                 forbidden_extensions=forbidden_extensions,
+                 include_patterns=consumer_kwargs.get("include_patterns"),
+                 exclude_patterns=consumer_kwargs.get("exclude_patterns"),
+                 max_size=max_size)
@@ -0,0 +1,178 @@
+import asyncio
+import logging
+import re
+
+import aiohttp
+
+from core.exceptions import SegmentError
+from core.partial_download import open_partial_response
+from core.sink import create_sink, iter_chunks
+
+logger = logging.getLogger(__name__)
+
+MAX_SEGMENTS = 4
+
+
+def get_segment_count(download_settings):
+    if download_settings.conn_limit_per_host == 0:
+        return MAX_SEGMENTS
+    return min(MAX_SEGMENTS, download_settings.conn_limit_per_host)
+
+
+def can_segment(response, partial, download_settings):
+    threshold = download_settings.segmented_download_size * 1024 * 1024
+    if not threshold or response.status != 200 or partial.bytes_written:
+        return False
+
+    if not partial.accept_ranges or partial.get_validator() is None:
+        return False
+
+    if response.content_length is None or response.content_length < threshold:
+        return False
+
+    return get_segment_count(download_settings) > 1
+
+
+def split_ranges(size, count):
+    segment_size = -(-size // count)
+    return [(start, min(start + segment_size, size) - 1) for start in range(0, size, segment_size)]
+
+
+def acquire_slots(controller, host, count):
+    if controller is None:
+        return count
+    slots = 0
+    while slots < count and controller.try_acquire(host):
+        slots += 1
+    return slots
+
+
+async def download_segmented(session, url, response, partial, session_kwargs, download_settings,
+                             controller=None, content_hashes=None):
+    """
+    Uses the already open response for the first segment, so it stays the
+    hashed prefix of the partial file, and fetches the others with range requests.
+    Every other segment needs a free slot of the host, waiting for one could deadlock
+    with the other downloads, so there are only as many segments as slots are free.
+    Falls back to a single stream if the server doesn't honor the ranges or a segment fails.
+    If the assembled file doesn't match the content_hashes of the site, it is downloaded again.
+    """
+    slots = acquire_slots(controller, url.host, get_segment_count(download_settings) - 1)
+    try:
+        if not slots:
+            async for chunk in iter_chunks(response):
+                await partial.write(chunk)
+            return
+        await _download_segmented(session, url, response, partial, session_kwargs, download_settings, slots + 1,
+                                  content_hashes)
+    finally:
+        if controller is not None:
+            for _ in range(slots):
+                controller.release(url.host)
+
+
+async def _download_segmented(session, url, response, partial, session_kwargs, download_settings, count,
+                              content_hashes):
+    size = response.content_length
+    ranges = split_ranges(size, count)
+
+    logger.debug(f"Downloading {url} in {len(ranges)} segments")
+
+    partial.file.truncate(size)
+
+    segment_kwargs = dict(session_kwargs)
+    headers = dict(segment_kwargs.get("headers", {}))
+    headers.pop("If-None-Match", None)
+    headers["If-Range"] = partial.get_validator()
+    segment_kwargs["headers"] = headers
+
+    tasks = [asyncio.ensure_future(_download_first_segment(response, partial, ranges[0][1] + 1))]
+    for start, end in ranges[1:]:
+        coroutine = _download_segment(session, url, partial.path, start, end, segment_kwargs)
+        tasks.append(asyncio.ensure_future(coroutine))
+
+    try:
+        await asyncio.gather(*tasks)
+    except (SegmentError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+        logger.debug(f"Segmented download of {url} failed: {e}. Falling back to a single stream")
+        await _cancel(tasks)
+        response.close()
+        await download_rest(session, url, partial, session_kwargs, download_settings)
+        return
+    except BaseException as e:
+        await _cancel(tasks)
+        raise e
+
+    loop = asyncio.get_event_loop()
+    await partial.finish()
+    await loop.run_in_executor(None, partial.extend_hash, size)
+
+    if partial.bytes_written != size:
+        raise SegmentError(f"Assembled file has {partial.bytes_written} bytes. Expected {size}")
+
+    if not await loop.run_in_executor(None, partial.matches_content_hashes, content_hashes):
+        logger.warning(f"Segmented download of {url} doesn't match the checksum of the server. Downloading it again")
+        partial.discard()
+        await download_rest(session, url, partial, session_kwargs, download_settings)
+
+
+async def download_rest(session, url, partial, session_kwargs, download_settings):
+    headers = dict(session_kwargs.get("headers", {}))
+    headers.pop("If-None-Match", None)
+    session_kwargs = {**session_kwargs, "headers": headers}
+
+    partial.close()
+    async with open_partial_response(session, url, session_kwargs, partial) as response:
+        response.raise_for_status()
+        partial.open(response, checkpoint=download_settings.resume_downloads)
+        async for chunk in iter_chunks(response):
+            await partial.write(chunk)
+
+
+async def _download_first_segment(response, partial, size):
+    async for chunk in iter_chunks(response, limit=size):
+        await partial.write(chunk)
+
+    # frees the connection for the other segments
+    response.close()
+
+    await partial.finish()
+    if partial.bytes_written != size:
+        raise SegmentError(f"First segment ended after {partial.bytes_written} bytes")
+
+
+async def _download_segment(session, url, path, start, end, session_kwargs):
+    session_kwargs = {**session_kwargs, "headers": {**session_kwargs["headers"], "Range": f"bytes={start}-{end}"}}
+    try:
+        response = await session.get(url, timeout=aiohttp.ClientTimeout(total=0), **session_kwargs)
+    except aiohttp.ClientResponseError as e:
+        raise SegmentError(f"Range request failed with {e.status}")
+
+    async with response:
+        if response.status != 206:
+            raise SegmentError(f"Server answered a range request with {response.status}")
+
+        match = re.match(r"bytes (\d+)-(\d+)", response.headers.get("Content-Range", ""))
+        if match is None or int(match.group(1)) != start or int(match.group(2)) != end:
+            raise SegmentError(f"Server returned an unexpected range: {response.headers.get('Content-Range')}")
+
+        position = start
+        with open(path, "r+b") as f:
+            f.seek(start)
+            sink = create_sink(f, end + 1 - start)
+            try:
+                async for chunk in iter_chunks(response, limit=end + 1 - start):
+                    await sink.write(chunk)
+                    position += len(chunk)
+                await sink.close()
+            finally:
+                sink.abort()
+
+    if position != end + 1:
+        raise SegmentError(f"Segment {start}-{end} ended after {position - start} bytes")
+
+
+async def _cancel(tasks):
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import os
+import queue
+import threading
+
+logger = logging.getLogger(__name__)
+
+MIN_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 4 * 1024 * 1024
+# smaller files are written on the event loop
+THREADED_MIN_SIZE = 1024 * 1024
+MAX_BACKLOG_BYTES = 8 * 1024 * 1024
+
+
+async def iter_chunks(response, limit=None):
+    """
+    Reads the body with a chunk size that doubles every time the stream
+    had more data buffered than we asked for.
+    """
+    chunk_size = MIN_CHUNK_SIZE
+    remaining = limit
+    while remaining is None or remaining > 0:
+        size = chunk_size if remaining is None else min(chunk_size, remaining)
+        chunk = await response.content.read(size)
+        if not chunk:
+            return
+        if remaining is not None:
+            remaining -= len(chunk)
+        yield chunk
+        if len(chunk) == size and chunk_size < MAX_CHUNK_SIZE:
+            chunk_size *= 2
+
+
+async def read_prefix(response, size):
+    """Reads at least size bytes, unless the body is shorter"""
+    prefix = b""
+    while len(prefix) < size:
+        chunk = await response.content.read(size - len(prefix))
+        if not chunk:
+            break
+        prefix += chunk
+    return prefix
+
+
+def preallocate(file, size):
+    if not hasattr(os, "posix_fallocate") or not size:
+        return
+    try:
+        os.posix_fallocate(file.fileno(), file.tell(), size)
+    except OSError as e:
+        logger.debug(f"Could not preallocate {size} bytes for {file.name}. {type(e).__name__}: {e}")
+
+
+class Sink(object):
+    """Writes every chunk directly on the event loop thread"""
+
+    def __init__(self, file, on_write=None):
+        self.file = file
+        self.on_write = on_write
+
+    async def write(self, chunk):
+        self.file.write(chunk)
+        if self.on_write is not None:
+            self.on_write(chunk)
+
+    async def close(self):
+        pass
+
+    def abort(self):
+        pass
+
+
+class Writer(object):
+    """
+    One thread for the writes and hashes of all sinks. The files are on the same
+    disk anyway and the order of the chunks of a file is kept by the single queue
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def submit(self, func, *args):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="sink-writer", daemon=True)
+                self._thread.start()
+        self._queue.put((func, args))
+
+    def _run(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception as e:
+                # the other sinks still need the thread
+                logger.error(f"Writer job failed. {type(e).__name__}: {e}", exc_info=True)
+
+
+writer = Writer()
+
+
+class ThreadedSink(Sink):
+    """
+    Hands the chunks to the shared writer thread, which writes and hashes them.
+    The chunks are immutable bytes, so they aren't copied. Once more than
+    MAX_BACKLOG_BYTES of a sink are in flight, the producing coroutine is
+    suspended until the writer caught up to half of it.
+
+    Errors of the writes are kept and raised by the next write or by close.
+    The received bytes are handed over as they are, pooled buffers would
+    only add a copy on the event loop.
+    """
+
+    def __init__(self, file, on_write=None):
+        super().__init__(file, on_write=on_write)
+        self.loop = asyncio.get_event_loop()
+        self.error = None
+        self.pending_bytes = 0
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._lock = threading.Lock()
+        self._aborted = False
+
+    def _write(self, chunk):
+        # runs in the writer thread
+        try:
+            with self._lock:
+                if self.error is None and not self._aborted:
+                    self.file.write(chunk)
+                    if self.on_write is not None:
+                        self.on_write(chunk)
+        except Exception as e:
+            self.error = e
+        self._call_soon(self._written, len(chunk))
+
+    def _call_soon(self, callback, *args):
+        # runs in the writer thread
+        try:
+            self.loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:
+            # the loop is closed, after a cancelled run nobody waits for the sink anymore
+            pass
+
+    def _written(self, length):
+        self.pending_bytes -= length
+        if self.pending_bytes <= MAX_BACKLOG_BYTES // 2:
+            self._drained.set()
+
+    def _raise_error(self):
+        if self.error is not None:
+            raise self.error
+
+    async def write(self, chunk):
+        self._raise_error()
+        if not isinstance(chunk, bytes):
+            # only bytes can't change, while they wait for the writer
+            chunk = bytes(chunk)
+        self.pending_bytes += len(chunk)
+        writer.submit(self._write, chunk)
+        if self.pending_bytes > MAX_BACKLOG_BYTES:
+            self._drained.clear()
+            await self._drained.wait()
+
+    async def close(self):
+        future = self.loop.create_future()
+        writer.submit(self._call_soon, _set_result, future)
+        await future
+        self._raise_error()
+
+    def abort(self):
+        # drops the chunks, which are still queued. Only a write, which already
+        # started, is waited for, so the file and the hashes stay consistent
+        with self._lock:
+            self._aborted = True
+
+
+def _set_result(future):
+    if not future.done():
+        future.set_result(None)
+
+
+def create_sink(file, content_length=None, on_write=None):
+    if content_length is not None and content_length < THREADED_MIN_SIZE:
+        return Sink(file, on_write=on_write)
+    return ThreadedSink(file, on_write=on_write)
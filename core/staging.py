@@ -0,0 +1,67 @@
+import errno
+import hashlib
+import logging
+import os
+import random
+import shutil
+from pathlib import Path
+
+import core.utils
+from core.constants import STAGING_FOLDER_NAME
+
+logger = logging.getLogger(__name__)
+
+
+def get_staging_path(save_path):
+    staging_path = os.path.join(save_path, STAGING_FOLDER_NAME)
+    Path(staging_path).mkdir(parents=True, exist_ok=True)
+    return staging_path
+
+
+def get_partial_path(save_path, absolute_path):
+    # stable name, so an interrupted download is found again on the next run
+    name = hashlib.md5(os.path.normcase(absolute_path).encode("utf-8")).hexdigest()
+    return os.path.join(get_staging_path(save_path), name + ".part")
+
+
+def get_temp_path(save_path, extension=None):
+    file_name = core.utils.add_extension(f"{random.getrandbits(64)}", extension)
+    return os.path.join(get_staging_path(save_path), file_name)
+
+
+def move_file(src, dst):
+    try:
+        os.replace(src, dst)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise e
+        logger.debug(f"{src} and {dst} are on different filesystems. Copying instead")
+        shutil.move(src, dst)
+
+
+def stage_old_version(absolute_path, staged_path):
+    """
+    Keeps the current content of absolute_path at staged_path. A hardlink keeps
+    the original in place until the new version replaces it, if the filesystem
+    doesn't support them, the file is renamed instead.
+    """
+    try:
+        os.link(absolute_path, staged_path)
+    except OSError as e:
+        logger.debug(f"Could not hardlink {absolute_path}. {type(e).__name__}: {e}. Renaming instead")
+        move_file(absolute_path, staged_path)
+
+
+def remove_staged_files(save_path):
+    staging_path = os.path.join(save_path, STAGING_FOLDER_NAME)
+    if not os.path.isdir(staging_path):
+        return
+    for file_name in os.listdir(staging_path):
+        if file_name.endswith(".part") or file_name.endswith(".part.json"):
+            continue
+        path = os.path.join(staging_path, file_name)
+        logger.debug(f"Removing staged file: {path}")
+        if os.path.isfile(path):
+            os.remove(path)
+        else:
+            shutil.rmtree(path, ignore_errors=True)
@@ -4,7 +4,7 @@ from core.storage import cache
 
 
 def _exit():
-    cache.save_jsons()
+    cache.close()
 
 
 atexit.register(_exit)
@@ -1,52 +1,79 @@
-import json
+import asyncio
 import logging
 import os
 
 import core.utils
-from core.storage.utils import get_json_cache_path
+from core.storage.database import Database
+from core.storage.policy import CachePolicy, MISSING, DAY
+from core.storage.utils import get_json_cache_path, get_cache_path
 
 logger = logging.getLogger(__name__)
 
-loaded_jsons = {}
+DATABASE_NAME = "cache.sqlite3"
+CHECKPOINT_POLL_SECONDS = 1
+
+URL_REFERENCE_POLICY = CachePolicy("url_reference", max_entries=20000, ttl=90 * DAY)
+EXTENSIONS_POLICY = CachePolicy("extensions", max_entries=50000, ttl=365 * DAY)
+FILENAMES_POLICY = CachePolicy("filenames", max_entries=50000, ttl=365 * DAY)
+POLICIES = [URL_REFERENCE_POLICY, EXTENSIONS_POLICY, FILENAMES_POLICY]
+
+_database = None
+_dry_run = False
+
+
+def get_database():
+    global _database
+    if _database is None:
+        _database = Database(os.path.join(get_cache_path(), DATABASE_NAME), json_path=get_json_cache_path())
+    return _database
 
 
 def get_json(name):
-    if name not in loaded_jsons:
-        load_json(name)
-    return loaded_jsons[name]["value"]
-
-
-def set_json(name, value, path):
-    item = {
-        "value": value,
-        "meta": {
-            "path": path,
-        },
-    }
-    loaded_jsons[name] = item
-
-
-def load_json(name):
-    logger.debug(f"Loading {name} json")
-    path = os.path.join(get_json_cache_path(), name + ".json")
-    if not os.path.exists(path):
-        set_json(name, {}, path)
-    else:
-        with open(path, "r") as f:
-            set_json(name, json.load(f), path)
+    """Returns a dict-like table, which is kept in the database. The json files are migrated on first use"""
+    return get_database().get_table(name)
+
+
+def set_dry_run(dry_run):
+    """Nothing is committed during a dry run and its changes are dropped, when it ends"""
+    global _dry_run
+    if dry_run and not _dry_run:
+        # the changes from before the dry run are kept
+        commit()
+    if _dry_run and not dry_run and _database is not None:
+        _database.discard_changes()
+    _dry_run = dry_run
+
 
+def is_dry_run():
+    return _dry_run
 
-def save_json(path, value):
-    with open(path, "w+") as f:
-        json.dump(value, f)
 
+def commit():
+    if _database is not None and not _dry_run:
+        _database.commit()
 
-def save_jsons():
-    logger.debug("Cleaning up lockup table")
-    for name, item in loaded_jsons.items():
-        path = item["meta"]["path"]
-        save_json(path, item["value"])
-    loaded_jsons.clear()
+
+async def run_checkpoints():
+    """
+    Commits after CHECKPOINT_WRITES writes or CHECKPOINT_SECONDS. Only collecting the
+    changed rows runs in the event loop, the write and the sync run in an executor
+    """
+    loop = asyncio.get_event_loop()
+    while True:
+        await asyncio.sleep(CHECKPOINT_POLL_SECONDS)
+        if _database is not None and not _dry_run and _database.should_checkpoint():
+            _database.collect_changes()
+            await loop.run_in_executor(None, _database.write_changes)
+
+
+def close():
+    global _database
+    if _database is not None:
+        if not _dry_run:
+            logger.debug("Committing cache")
+            _database.commit()
+        _database.close()
+        _database = None
 
 
 def get_file_meta_data(path):
@@ -56,31 +83,83 @@ def get_file_meta_data(path):
     return table[path]
 
 
+def move_file_meta_data(old_path, new_path):
+    """Keeps the checksums and etags of the files in a folder, which was moved"""
+    table = get_json("file_meta_data")
+    prefix = os.path.join(old_path, "")
+    for path, meta_data in table.iter_items():
+        if path.startswith(prefix):
+            table[os.path.join(new_path, path[len(prefix):])] = meta_data
+            del table[path]
+
+
+def enforce_policies():
+    for policy in POLICIES:
+        policy.enforce()
+
+
+def prune(owners):
+    """Removes the expired entries and the ones of template nodes, which are not in owners"""
+    removed = {policy.name: policy.prune(owners) for policy in POLICIES}
+
+    folder_names = get_json("folder_name")
+    removed["folder_name"] = 0
+    for kwargs_hash in list(folder_names):
+        if kwargs_hash not in owners:
+            del folder_names[kwargs_hash]
+            removed["folder_name"] += 1
+
+    commit()
+    return removed
+
+
+def log_stats():
+    for policy in POLICIES:
+        policy.log_stats()
+
+
 async def check_url_reference(session, url):
-    table = get_json("url_reference")
-    new_url = table.get(url, None)
+    new_url = URL_REFERENCE_POLICY.lookup(url)
+
+    if new_url is MISSING:
+        async def request():
+            async with session.get(url, raise_for_status=False) as response:
+                return str(response.url)
 
-    if new_url is None:
-        async with session.get(url, raise_for_status=False) as response:
-            new_url = str(response.url)
-        table[url] = new_url
+        new_url = await session.single_flight(("url_reference", url), request)
+        URL_REFERENCE_POLICY.store(url, new_url)
         logger.debug(f"Called url_reference, url: {url}, new url: {new_url}")
 
     return new_url
 
 
+def lookup_extension(url):
+    """Returns the cached extension or MISSING"""
+    return EXTENSIONS_POLICY.lookup(url)
+
+
+def is_extension_known(url):
+    return EXTENSIONS_POLICY.lookup(url, count=False) is not MISSING
+
+
+def save_extension(url, extension):
+    EXTENSIONS_POLICY.store(url, extension)
+
+
 async def check_extension(session, url, session_kwargs=None):
     if session_kwargs is None:
         session_kwargs = {}
 
-    table = get_json("extensions")
-    if url in table:
-        return table[url]
+    extension = lookup_extension(url)
+    if extension is not MISSING:
+        return extension
 
-    async with session.get(url, raise_for_status=True, **session_kwargs) as response:
-        extension = core.utils.get_extension_from_response(response)
+    async def request():
+        async with session.get(url, raise_for_status=True, **session_kwargs) as response:
+            return core.utils.get_extension_from_response(response)
 
-    table[url] = extension
+    extension = await session.single_flight(("extension", url), request)
+    save_extension(url, extension)
     logger.debug(f"Called filename_cache, url: {url}, extension: {extension}")
 
     return extension
@@ -90,14 +169,17 @@ async def check_filename(session, url, session_kwargs=None):
     if session_kwargs is None:
         session_kwargs = {}
 
-    table = get_json("filenames")
-    if url in table:
-        return table[url]
+    filename = FILENAMES_POLICY.lookup(url)
+    if filename is not MISSING:
+        return filename
+
+    async def request():
+        async with session.get(url, raise_for_status=True, **session_kwargs) as response:
+            return core.utils.get_filename_from_response(response)
 
-    async with session.get(url, raise_for_status=True, **session_kwargs) as response:
-        filename = core.utils.get_filename_from_response(response)
+    filename = await session.single_flight(("filename", url), request)
 
-    table[url] = filename
+    FILENAMES_POLICY.store(url, filename)
     logger.debug(f"Called filename_cache, url: {url}, extension: {filename}")
 
     return filename
@@ -154,6 +236,7 @@ def save_checksum(path, checksum):
         logger.debug(f"Replaced old checksum, path: {path}, new: {checksum}, old: {old_checksum}")
 
     meta_data["checksum"] = checksum
+    get_json("file_meta_data").mark_dirty(path)
 
 
 def save_own_checksum(path, checksum):
@@ -173,6 +256,7 @@ def save_own_checksum(path, checksum):
         logger.debug(f"Replaced old own_checksum, path: {path}, new: {checksum}, old: {old_checksum}")
 
     meta_data["own_checksum"] = checksum
+    get_json("file_meta_data").mark_dirty(path)
 
 
 def get_etag(path):
@@ -189,3 +273,4 @@ def save_etag(path, etag):
         logger.debug(f"Adding new etag. New: {etag}")
 
     meta_data["etag"] = etag
+    get_json("file_meta_data").mark_dirty(path)
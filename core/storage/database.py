@@ -0,0 +1,273 @@
+import collections.abc
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DATABASE_VERSION = 1
+CHECKPOINT_SECONDS = 5
+CHECKPOINT_WRITES = 2000
+# get_file_meta_data and others create empty entries for every lookup
+EMPTY_VALUES = {"{}", "[]"}
+
+
+class Table(collections.abc.MutableMapping):
+    """
+    A dict, which reads its rows from the database when they are first used.
+    Only the rows, which were set or marked with mark_dirty since the last
+    commit, are serialized and written. Whoever changes a dict or list value
+    in place has to call mark_dirty and should hold the lock, if the table is
+    used from more than one thread.
+    """
+
+    def __init__(self, database, name):
+        self.database = database
+        self.name = name
+        self.lock = database.lock
+        self._values = {}
+        self._saved = set()
+        self._missing = set()
+        self._deleted = set()
+        self._dirty = set()
+        self._complete = False
+
+    def __getitem__(self, key):
+        with self.lock:
+            if key in self._values:
+                return self._values[key]
+            if self._complete or key in self._missing:
+                raise KeyError(key)
+
+            raw = self.database.read(self.name, key)
+            if raw is None:
+                self._missing.add(key)
+                raise KeyError(key)
+
+            self._values[key] = json.loads(raw)
+            self._saved.add(key)
+            return self._values[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self._values[key] = value
+            self._dirty.add(key)
+            self._missing.discard(key)
+            self._deleted.discard(key)
+        self.database.note_write()
+
+    def __delitem__(self, key):
+        with self.lock:
+            self[key]
+            del self._values[key]
+            self._dirty.discard(key)
+            self._missing.add(key)
+            if key in self._saved:
+                self._deleted.add(key)
+        self.database.note_write()
+
+    def __iter__(self):
+        self.load_all()
+        with self.lock:
+            return iter(list(self._values))
+
+    def __len__(self):
+        self.load_all()
+        return len(self._values)
+
+    def max_len(self):
+        """
+        The number of rows without loading the table. Rows, which were set
+        before they were read, are counted twice, if they are also committed
+        """
+        with self.lock:
+            if self._complete:
+                return len(self._values)
+            return self.database.count(self.name) + len(self._dirty - self._saved)
+
+    def mark_dirty(self, key):
+        """Has to be called after the value of key was changed in place"""
+        with self.lock:
+            if key in self._values:
+                self._dirty.add(key)
+        self.database.note_write()
+
+    def iter_items(self):
+        self.load_all()
+        with self.lock:
+            return iter(list(self._values.items()))
+
+    def load_all(self):
+        with self.lock:
+            if self._complete:
+                return
+            for key, raw in self.database.read_all(self.name):
+                if key not in self._values and key not in self._missing:
+                    self._values[key] = json.loads(raw)
+                    self._saved.add(key)
+            self._missing.clear()
+            self._complete = True
+
+    def discard_changes(self):
+        """Has to be called with the lock held, the rows are read again when they are used"""
+        self._values.clear()
+        self._saved.clear()
+        self._missing.clear()
+        self._deleted.clear()
+        self._dirty.clear()
+        self._complete = False
+
+    def get_changes(self):
+        """Has to be called with the lock held"""
+        changed = []
+        for key in self._dirty:
+            raw = json.dumps(self._values[key])
+            if key not in self._saved and raw in EMPTY_VALUES:
+                continue
+            changed.append((self.name, key, raw))
+            self._saved.add(key)
+        deleted = [(self.name, key) for key in self._deleted]
+        self._saved.difference_update(self._deleted)
+        self._dirty.clear()
+        self._deleted.clear()
+        return changed, deleted
+
+
+class Database(object):
+    """
+    Key-value rows in SQLite, grouped by the name of the former json file.
+    WAL mode lets a commit only append the changed rows, so the changes are
+    committed during the run after CHECKPOINT_WRITES writes or CHECKPOINT_SECONDS.
+
+    The changes are collected with the lock held and written with a separate
+    connection, so the write can run in another thread while the tables are
+    used and read from.
+    """
+
+    def __init__(self, path, json_path=None):
+        self.path = path
+        self.json_path = json_path
+        self.tables = {}
+        self.pending_writes = 0
+        self.last_commit = time.monotonic()
+        self.collected_changes = []
+        self.lock = threading.RLock()
+        self.write_lock = threading.Lock()
+        self.write_connection = self._connect(path)
+        self.write_connection.execute("PRAGMA journal_mode=WAL")
+        self.write_connection.execute("CREATE TABLE IF NOT EXISTS entries ("
+                                      "name TEXT NOT NULL, "
+                                      "key TEXT NOT NULL, "
+                                      "value TEXT NOT NULL, "
+                                      "PRIMARY KEY (name, key)) WITHOUT ROWID")
+        self.write_connection.execute(f"PRAGMA user_version={DATABASE_VERSION}")
+        self.connection = self._connect(path)
+
+    @staticmethod
+    def _connect(path):
+        connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # every commit is synced to the WAL, so a power loss can't lose more than CHECKPOINT_SECONDS
+        connection.execute("PRAGMA synchronous=FULL")
+        return connection
+
+    def get_table(self, name):
+        with self.lock:
+            if name not in self.tables:
+                self._migrate(name)
+                self.tables[name] = Table(self, name)
+            return self.tables[name]
+
+    def read(self, name, key):
+        with self.lock:
+            row = self.connection.execute("SELECT value FROM entries WHERE name = ? AND key = ?",
+                                          (name, key)).fetchone()
+        return row[0] if row is not None else None
+
+    def count(self, name):
+        with self.lock:
+            return self.connection.execute("SELECT COUNT(*) FROM entries WHERE name = ?", (name,)).fetchone()[0]
+
+    def read_all(self, name):
+        with self.lock:
+            return self.connection.execute("SELECT key, value FROM entries WHERE name = ?", (name,)).fetchall()
+
+    @staticmethod
+    def _write(connection, collected_changes):
+        connection.execute("BEGIN")
+        try:
+            for changed, deleted in collected_changes:
+                connection.executemany("INSERT OR REPLACE INTO entries (name, key, value) VALUES (?, ?, ?)", changed)
+                connection.executemany("DELETE FROM entries WHERE name = ? AND key = ?", deleted)
+        except BaseException as e:
+            connection.execute("ROLLBACK")
+            raise e
+        connection.execute("COMMIT")
+
+    def note_write(self):
+        self.pending_writes += 1
+
+    def should_checkpoint(self):
+        if not self.pending_writes:
+            return False
+        return self.pending_writes >= CHECKPOINT_WRITES or time.monotonic() - self.last_commit >= CHECKPOINT_SECONDS
+
+    def collect_changes(self):
+        """Serializes the changed rows, write_changes writes them"""
+        with self.lock:
+            self.pending_writes = 0
+            self.last_commit = time.monotonic()
+            for table in self.tables.values():
+                table_changed, table_deleted = table.get_changes()
+                if table_changed or table_deleted:
+                    self.collected_changes.append((table_changed, table_deleted))
+
+    def discard_changes(self):
+        """Forgets all changes, which weren't written yet"""
+        with self.lock:
+            self.pending_writes = 0
+            self.collected_changes = []
+            for table in self.tables.values():
+                table.discard_changes()
+
+    def write_changes(self):
+        """Can be called from any thread, the changes are written in the order they were collected"""
+        with self.write_lock:
+            with self.lock:
+                collected_changes, self.collected_changes = self.collected_changes, []
+            if not collected_changes:
+                return
+            self._write(self.write_connection, collected_changes)
+        num_changed = sum(len(changed) for changed, _ in collected_changes)
+        num_deleted = sum(len(deleted) for _, deleted in collected_changes)
+        logger.debug(f"Committed {num_changed} changed and {num_deleted} deleted cache entries")
+
+    def commit(self):
+        self.collect_changes()
+        self.write_changes()
+
+    def _migrate(self, name):
+        if self.json_path is None:
+            return
+        path = os.path.join(self.json_path, name + ".json")
+        if not os.path.exists(path):
+            return
+
+        try:
+            with open(path, "r") as f:
+                value = json.load(f)
+        except (ValueError, OSError) as e:
+            logger.warning(f"Could not migrate {path}. {type(e).__name__}: {e}")
+            return
+
+        logger.debug(f"Migrating {name} json with {len(value)} entries")
+        # runs with the lock held, which write_changes takes after the write_lock
+        self._write(self.connection, [([(name, key, json.dumps(item)) for key, item in value.items()], [])])
+        os.replace(path, path + ".migrated")
+
+    def close(self):
+        with self.lock, self.write_lock:
+            self.connection.close()
+            self.write_connection.close()
@@ -0,0 +1,112 @@
+import contextvars
+import logging
+import time
+
+from core.storage import cache
+
+logger = logging.getLogger(__name__)
+
+MISSING = object()
+DAY = 24 * 60 * 60
+# the last use is only written again after this time, so hits don't rewrite the rows every run
+USED_RESOLUTION = DAY
+EVICTION_RATIO = 0.9
+
+# the template node, which is running in the current task
+current_owner = contextvars.ContextVar("current_owner", default=None)
+
+
+def set_owner(owner):
+    current_owner.set(owner)
+
+
+def _get_used(entry):
+    return entry["used"] if isinstance(entry, dict) else 0
+
+
+class CachePolicy(object):
+    """
+    Entries of the table are wrapped with the time they were created and last used
+    and the template node, which created them. Entries older than ttl count as a miss.
+    If there are more than max_entries, the least recently used ones are removed.
+    """
+
+    def __init__(self, name, max_entries, ttl):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evicted = 0
+
+    def lookup(self, key, count=True):
+        """Returns the value or MISSING"""
+        table = cache.get_json(self.name)
+        if key not in table:
+            if count:
+                self.misses += 1
+            return MISSING
+
+        entry = table[key]
+        now = time.time()
+        if not isinstance(entry, dict):
+            # entry from before the policies
+            entry = {"value": entry, "created": now, "used": now, "owner": None}
+            table[key] = entry
+
+        if now - entry["created"] > self.ttl:
+            del table[key]
+            self.expired += 1
+            if count:
+                self.misses += 1
+            return MISSING
+
+        if now - entry["used"] > USED_RESOLUTION:
+            entry["used"] = now
+            table.mark_dirty(key)
+        if count:
+            self.hits += 1
+        return entry["value"]
+
+    def store(self, key, value):
+        now = time.time()
+        cache.get_json(self.name)[key] = {
+            "value": value,
+            "created": now,
+            "used": now,
+            "owner": current_owner.get(),
+        }
+
+    def enforce(self):
+        table = cache.get_json(self.name)
+        if table.max_len() <= self.max_entries:
+            return
+        # includes the entries, which aren't committed yet
+        count = len(table)
+        if count <= self.max_entries:
+            return
+        items = sorted(table.iter_items(), key=lambda item: _get_used(item[1]))
+        remove_count = count - int(self.max_entries * EVICTION_RATIO)
+        for key, entry in items[:remove_count]:
+            del table[key]
+        self.evicted += remove_count
+        logger.debug(f"Evicted {remove_count} entries from {self.name}")
+
+    def prune(self, owners):
+        """Removes the expired entries and the ones of template nodes, which are not in owners"""
+        table = cache.get_json(self.name)
+        now = time.time()
+        removed = 0
+        for key, entry in list(table.iter_items()):
+            if not isinstance(entry, dict):
+                continue
+            if now - entry["created"] > self.ttl or (entry["owner"] is not None and entry["owner"] not in owners):
+                del table[key]
+                removed += 1
+        return removed
+
+    def log_stats(self):
+        if self.hits or self.misses:
+            logger.debug(f"{self.name}: {self.hits} hit(s), {self.misses} miss(es), "
+                         f"{self.expired} expired and {self.evicted} evicted")
@@ -1,9 +1,10 @@
-import copy
+import hashlib
 import json
 import logging
 import os
 import pickle
-import random
+import time
+import zlib
 from collections.abc import Iterable
 from functools import lru_cache
 from pathlib import Path
@@ -13,6 +14,9 @@ from core.storage import cache
 
 logger = logging.getLogger(__name__)
 
+FUNCTION_RESULTS_TABLE = "function_results"
+MAX_FUNCTION_RESULTS_BYTES = 100 * 1024 * 1024
+
 
 @lru_cache(maxsize=None)
 def get_cache_path():
@@ -35,6 +39,20 @@ def get_function_cache_path():
     return function_cache_path
 
 
+@lru_cache(maxsize=None)
+def get_http_cache_path():
+    http_cache_path = os.path.join(get_cache_path(), "http")
+    Path(http_cache_path).mkdir(parents=True, exist_ok=True)
+    return http_cache_path
+
+
+@lru_cache(maxsize=None)
+def get_template_cache_path():
+    template_cache_path = os.path.join(get_cache_path(), "templates")
+    Path(template_cache_path).mkdir(parents=True, exist_ok=True)
+    return template_cache_path
+
+
 def is_jsonable(x):
     try:
         json.dumps(x)
@@ -49,40 +67,105 @@ async def call_function_or_cache(func, identifier, *args, **kwargs):
 
     func_identifier = get_func_identifier(args, kwargs)
     attributes = table.get(func_identifier, {})
-    cache_identifier = copy.copy(attributes.get("identifier", None))
-    try:
-        if identifier is not None and identifier == cache_identifier:
-            if attributes["pickle"]:
-                with open(attributes["value"], "rb") as f:
-                    return pickle.load(f)
-
+    if identifier is not None and identifier == attributes.get("identifier", None):
+        if "blob" in attributes:
+            try:
+                return load_function_result(attributes["blob"])
+            except FileNotFoundError:
+                logger.warning("Function result could not be found")
+        elif not attributes.get("pickle", False):
             return attributes["value"]
-    except FileNotFoundError:
-        logger.warning("Pickle file could not be found")
-        pass
 
     result = await func(*args, **kwargs)
 
     if identifier is not None:
         logger.debug(f"Called function: {json_name}, func_identifier: {func_identifier}")
-    attributes["identifier"] = identifier
 
+    new_attributes = {"identifier": identifier}
     if is_jsonable(result):
-        attributes["value"] = result
-        attributes["pickle"] = False
+        new_attributes["value"] = result
     else:
-        file_name = str(random.randint(int(1e18), int(1e19))) + ".pickle"
-        path = os.path.join(get_function_cache_path(), file_name)
-        attributes["value"] = path
-        attributes["pickle"] = True
+        new_attributes["blob"] = save_function_result(result)
+
+    if "blob" in attributes:
+        release_function_result(attributes["blob"])
 
-        with open(path, "wb+") as f:
-            pickle.dump(result, f)
+    table[func_identifier] = new_attributes
+    return result
+
+
+def get_function_result_path(key):
+    return os.path.join(get_function_cache_path(), key + ".pickle.z")
+
+
+def save_function_result(result):
+    """Stores the pickled result under the hash of its content and returns the hash"""
+    data = zlib.compress(pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+    key = hashlib.sha256(data).hexdigest()
+    path = get_function_result_path(key)
+    if not os.path.exists(path):
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
 
-    table[func_identifier] = attributes
+    blobs = cache.get_json(FUNCTION_RESULTS_TABLE)
+    refs = blobs[key]["refs"] if key in blobs else 0
+    blobs[key] = {"size": len(data), "refs": refs + 1, "used": time.time()}
+    return key
+
+
+def load_function_result(key):
+    with open(get_function_result_path(key), "rb") as f:
+        result = pickle.loads(zlib.decompress(f.read()))
+
+    blobs = cache.get_json(FUNCTION_RESULTS_TABLE)
+    if key in blobs:
+        blobs[key]["used"] = time.time()
+        blobs.mark_dirty(key)
     return result
 
 
+def release_function_result(key):
+    blobs = cache.get_json(FUNCTION_RESULTS_TABLE)
+    if key in blobs:
+        blobs[key]["refs"] -= 1
+        blobs.mark_dirty(key)
+
+
+def collect_function_results(max_bytes=MAX_FUNCTION_RESULTS_BYTES):
+    """
+    Removes the results, which aren't referenced anymore, and the least recently used
+    ones, if all of them take more than max_bytes. Files, which are not known, like the
+    pickles of older versions, are removed as well.
+    """
+    blobs = cache.get_json(FUNCTION_RESULTS_TABLE)
+    removed = 0
+    for key, blob in blobs.iter_items():
+        if blob["refs"] <= 0:
+            del blobs[key]
+            removed += 1
+
+    size = sum(blob["size"] for _, blob in blobs.iter_items())
+    for key, blob in sorted(blobs.iter_items(), key=lambda item: item[1]["used"]):
+        if size <= max_bytes:
+            break
+        # the entries, which reference it, will call the function again
+        del blobs[key]
+        size -= blob["size"]
+        removed += 1
+
+    known_files = {os.path.basename(get_function_result_path(key)) for key, _ in blobs.iter_items()}
+    for file_name in os.listdir(get_function_cache_path()):
+        if file_name not in known_files:
+            try:
+                os.remove(os.path.join(get_function_cache_path(), file_name))
+            except OSError as e:
+                logger.warning(f"Could not remove function result {file_name}. {type(e).__name__}: {e}")
+
+    if removed:
+        logger.debug(f"Removed {removed} function result(s), {size} bytes are left")
+
+
 def get_func_identifier(args, kwargs):
     result = ""
     for item in args:
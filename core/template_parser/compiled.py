@@ -0,0 +1,57 @@
+import hashlib
+import logging
+import os
+import pickle
+
+from core.constants import VERSION
+from core.storage import cache
+from core.storage.utils import get_template_cache_path
+
+logger = logging.getLogger(__name__)
+
+# has to be increased, if the stored nodes change
+COMPILED_VERSION = 1
+
+
+def get_key(content):
+    """The sites can change with the version, so they have to be validated again"""
+    key_string = f"{VERSION}|{COMPILED_VERSION}|".encode("utf-8") + content
+    return hashlib.sha256(key_string).hexdigest()
+
+
+def get_path(key):
+    return os.path.join(get_template_cache_path(), key + ".pickle")
+
+
+def load(key):
+    """Returns the compiled nodes of the template or None"""
+    try:
+        with open(get_path(key), "rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"Could not load compiled template. {type(e).__name__}: {e}")
+        return None
+
+
+def save(template_path, key, compiled_nodes):
+    path = get_path(key)
+    try:
+        with open(path + ".tmp", "wb") as f:
+            pickle.dump(compiled_nodes, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + ".tmp", path)
+    except OSError as e:
+        logger.warning(f"Could not save compiled template. {type(e).__name__}: {e}")
+        return
+
+    # only the newest version of every template is kept
+    table = cache.get_json("compiled_templates")
+    template_path = os.path.normcase(os.path.abspath(template_path))
+    old_key = table.get(template_path, None)
+    if old_key is not None and old_key != key:
+        try:
+            os.remove(get_path(old_key))
+        except FileNotFoundError:
+            pass
+    table[template_path] = key
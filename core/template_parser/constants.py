@@ -1 +1,5 @@
-POSSIBLE_CONSUMER_KWARGS = ["allowed_extensions", "forbidden_extensions"]
\ No newline at end of file
+POSSIBLE_CONSUMER_KWARGS = ["allowed_extensions",
+                            "forbidden_extensions",
+                            "include_patterns",
+                            "exclude_patterns",
+                            "max_size"]
\ No newline at end of file
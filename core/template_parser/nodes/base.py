@@ -50,7 +50,9 @@ class TemplateNode(object):
                  use_folder=True,
                  is_producer=False,
                  meta_data=None,
-                 link_collection=None):
+                 link_collection=None,
+                 kwargs_hash=None,
+                 unique_key=None):
         if meta_data is None:
             meta_data = {}
         if link_collection is None:
@@ -67,9 +69,14 @@ class TemplateNode(object):
 
         self.child_index = self._init_parent()
         self.position = self._init_position()
-        self.kwargs_hash = get_kwargs_hash(self.unique_key_kwargs)
-
-        self.unique_key = self._init_unique_key()
+        # a compiled template already knows the hashes
+        if kwargs_hash is None:
+            kwargs_hash = get_kwargs_hash(self.unique_key_kwargs)
+        self.kwargs_hash = kwargs_hash
+
+        if unique_key is None:
+            unique_key = self._init_unique_key()
+        self.unique_key = unique_key
         self.folder_name = self._init_folder_name(folder_name)
         self.base_path = self._init_base_path(use_folder)
 
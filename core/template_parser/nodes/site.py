@@ -8,11 +8,13 @@ import time
 import core.utils
 from core.exceptions import ParseTemplateError, ParseTemplateRuntimeError
 from core.storage import cache
+from core.storage.policy import set_owner
 from core.template_parser.nodes import site_configs
 from core.template_parser.nodes.base import TemplateNode
 from core.template_parser.queue_wrapper import QueueWrapper
 from core.template_parser.utils import get_module_function, check_if_null, dict_to_string, safe_login_module
 from gui.constants import SITE_ICON_PATH
+from sites.constants import SITE_ENTRY_POINTS
 
 logger = logging.getLogger(__name__)
 
@@ -28,6 +30,7 @@ class Site(TemplateNode):
                  raw_login_function,
                  function_kwargs,
                  consumer_kwargs,
+                 resolved_names=None,
                  **kwargs):
         super().__init__(parent=parent,
                          folder_name=raw_folder_name,
@@ -51,14 +54,20 @@ class Site(TemplateNode):
         self.raw_folder_function = raw_folder_function
         self.raw_login_function = raw_login_function
 
-        self.folder_module_name, self.folder_function_name = self.get_folder_module_func_name(raw_module_name,
-                                                                                              raw_folder_function,
-                                                                                              raw_folder_name,
-                                                                                              use_folder)
-        self.module_name, self.function_name = self.get_module_func_name(raw_module_name,
-                                                                         raw_function)
-        self.login_module_name, self.login_function_name = self.get_login_func_name(raw_module_name,
-                                                                                    raw_login_function)
+        # the children run with a cached folder name right away, it's verified while they run
+        self.is_folder_name_cached = raw_folder_name is None and self.folder_name is not None
+        self.renamed_folder_name = None
+
+        if resolved_names is None:
+            resolved_names = (
+                *self.get_folder_module_func_name(raw_module_name, raw_folder_function, raw_folder_name, use_folder),
+                *self.get_module_func_name(raw_module_name, raw_function),
+                *self.get_login_func_name(raw_module_name, raw_login_function),
+            )
+
+        (self.folder_module_name, self.folder_function_name,
+         self.module_name, self.function_name,
+         self.login_module_name, self.login_function_name) = resolved_names
 
     @staticmethod
     def get_unique_key_kwargs(**kwargs):
@@ -79,6 +88,17 @@ class Site(TemplateNode):
         except ModuleNotFoundError:
             raise ParseTemplateError(f"Module with name: {module_name} does not exist")
 
+    @staticmethod
+    def _check_function(module_name, function_name):
+        """Uses the manifest for the sites, so they are only imported once they run"""
+        entry_points = SITE_ENTRY_POINTS.get(module_name, None)
+        if entry_points is None:
+            module = Site._import_module(module_name)
+            Site._test_function_exist(module, function_name)
+        elif function_name not in entry_points:
+            raise ParseTemplateError(f"Function: {function_name} in module:"
+                                     f" {module_name} does not exist")
+
     @staticmethod
     def _test_function_exist(module, function_name):
         if not hasattr(module, function_name):
@@ -99,8 +119,7 @@ class Site(TemplateNode):
             module_name, function_name = get_module_function(raw_function)
 
         module_name = "sites." + module_name
-        site_module = Site._import_module(module_name)
-        Site._test_function_exist(site_module, function_name)
+        Site._check_function(module_name, function_name)
 
         return module_name, function_name
 
@@ -118,8 +137,7 @@ class Site(TemplateNode):
 
         if folder_module_name is not None:
             folder_module_name = "sites." + folder_module_name
-            folder_module = Site._import_module(folder_module_name)
-            Site._test_function_exist(folder_module, folder_function_name)
+            Site._check_function(folder_module_name, folder_function_name)
 
         return folder_module_name, folder_function_name
 
@@ -127,19 +145,26 @@ class Site(TemplateNode):
     def get_login_func_name(raw_module_name, raw_login_function):
         if raw_login_function is None:
             login_module_name = "sites." + raw_module_name
-            module = Site._import_module(login_module_name)
-            if hasattr(module, "login"):
+            entry_points = SITE_ENTRY_POINTS.get(login_module_name, None)
+            if entry_points is None:
+                entry_points = dir(Site._import_module(login_module_name))
+            if "login" in entry_points:
                 return login_module_name, "login"
             return None, None
 
         raw_login_parts = raw_login_function.split(".")
         login_module_name = ".".join(["sites"] + raw_login_parts[:-1])
         login_func_name = raw_login_parts[-1]
-        login_func_module = Site._import_module(login_module_name)
-        Site._test_function_exist(login_func_module, login_func_name)
+        Site._check_function(login_module_name, login_func_name)
 
         return login_module_name, login_func_name
 
+    def get_resolved_names(self):
+        """The validated module and function names, which a compiled template passes back in"""
+        return (self.folder_module_name, self.folder_function_name,
+                self.module_name, self.function_name,
+                self.login_module_name, self.login_function_name)
+
     def __str__(self):
         return self.module_name
 
@@ -205,6 +230,9 @@ class Site(TemplateNode):
         if check_if_null(self.function_kwargs):
             raise ParseTemplateRuntimeError("Found null field")
 
+        # cache entries created by this site and its producers can be pruned with it
+        set_owner(self.kwargs_hash)
+
         if self.login_module_name is not None:
             login_module = importlib.import_module(self.login_module_name)
             login_function = getattr(login_module, self.login_function_name)
@@ -218,13 +246,18 @@ class Site(TemplateNode):
 
             self.base_path = core.utils.safe_path_join(self.parent.base_path, self.folder_name)
             signal_handler.update_base_path(self.unique_key, self.base_path)
+        elif self.is_folder_name_cached and self.use_folder and self.folder_module_name is not None \
+                and not cache.is_dry_run():
+            producers.append(asyncio.ensure_future(self.verify_folder_name(session=session,
+                                                                           download_settings=download_settings)))
 
         queue_wrapper = QueueWrapper(queue,
                                      signal_handler=signal_handler,
                                      unique_key=self.unique_key,
                                      download_settings=download_settings,
                                      cancellable_pool=cancellable_pool,
-                                     **self.consumer_kwargs)
+                                     owner=self.kwargs_hash,
+                                     rule_kwargs=self.consumer_kwargs)
 
         site_module = importlib.import_module(self.module_name)
         producer_function = getattr(site_module, self.function_name)
@@ -240,18 +273,40 @@ class Site(TemplateNode):
         if self.folder_name is not None or self.folder_module_name is None:
             return self.folder_name
 
+        folder_name = await self.call_folder_function(session=session, download_settings=download_settings)
+
+        folder_name_cache = cache.get_json("folder_name")
+        folder_name_cache[self.kwargs_hash] = folder_name
+
+        signal_handler.update_folder_name(self.unique_key, folder_name)
+        return folder_name
+
+    async def call_folder_function(self, session, download_settings):
         folder_module = importlib.import_module(self.folder_module_name)
         function = getattr(folder_module, self.folder_function_name)
         logger.debug(f"Calling folder function: {function.__module__}."
                      f"{function.__name__}<{dict_to_string(self.function_kwargs)}>")
         folder_name = await function(session=session, download_settings=download_settings, **self.function_kwargs)
-        folder_name = folder_name.strip()
+        return folder_name.strip()
 
-        folder_name_cache = cache.get_json("folder_name")
-        folder_name_cache[self.kwargs_hash] = folder_name
+    async def verify_folder_name(self, session, download_settings):
+        """
+        Only records the new name. Template.move_renamed_folders moves the folder after the run
+        and updates the cache, so the cached name always matches the folder on disk
+        """
+        try:
+            folder_name = await self.call_folder_function(session=session, download_settings=download_settings)
+        except asyncio.CancelledError as e:
+            raise e
+        except Exception as e:
+            logger.debug(f"Could not verify the folder name of {self}. {type(e).__name__}: {e}")
+            return
 
-        signal_handler.update_folder_name(self.unique_key, folder_name)
-        return folder_name
+        if folder_name == self.folder_name:
+            return
+
+        logger.info(f"The folder name of {self} changed from '{self.folder_name}' to '{folder_name}'")
+        self.renamed_folder_name = folder_name
 
     def exception_handler(self, function, signal_handler):
         unique_key = self.unique_key
@@ -286,6 +341,9 @@ class Site(TemplateNode):
         return wrapper
 
     def has_website_url(self):
+        entry_points = SITE_ENTRY_POINTS.get(self.module_name, None)
+        if entry_points is not None:
+            return "get_website_url" in entry_points
         site_module = importlib.import_module(self.module_name)
         return hasattr(site_module, "get_website_url")
 
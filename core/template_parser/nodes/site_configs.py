@@ -10,7 +10,7 @@ from core.template_parser import nodes
 from core.template_parser.nodes.base import NodeConfigs
 from core.template_parser.nodes.utils import get_folder_name_from_kwargs
 from gui.constants import SITE_ICON_PATH
-from settings.config_objs import ConfigString, ConfigBool, ConfigOptions, ConfigDict, ConfigListString
+from settings.config_objs import ConfigString, ConfigBool, ConfigOptions, ConfigDict, ConfigListString, ConfigInt
 from sites.constants import POSSIBLE_LOGIN_FUNCTIONS
 
 logger = logging.getLogger(__name__)
@@ -227,6 +227,14 @@ class SiteConfigs(NodeConfigs):
                                                hint_text="Add 'video' for all video types"),
         "forbidden_extensions": ConfigListString(optional=True, gui_name="Forbidden Extensions",
                                                  hint_text="Add 'video' for all video types"),
+        "include_patterns": ConfigListString(optional=True, gui_name="Only Files Matching",
+                                             hint_text="Globs for the file name, globs with a '/' for "
+                                                       "the path or 're:' followed by a regex for the path"),
+        "exclude_patterns": ConfigListString(optional=True, gui_name="Skip Files Matching",
+                                             hint_text="Globs for the file name, globs with a '/' for "
+                                                       "the path or 're:' followed by a regex for the path"),
+        "max_size": ConfigInt(minimum=0, optional=True, gui_name="Maximum File Size (MB)",
+                              hint_text="0 for unlimited"),
     }, gui_name="Download Arguments")
 
     function_kwargs = FunctionKwargsConfigDict(gui_name="Function Specific Arguments")
@@ -1,12 +1,24 @@
-def queue_wrapper_put(obj, attr, **consumer_kwargs):
+import logging
+
+from core.rules import compile_rules
+
+logger = logging.getLogger(__name__)
+
+
+def queue_wrapper_put(obj, attr, rules, **consumer_kwargs):
     signal_handler = consumer_kwargs["signal_handler"]
     unique_key = consumer_kwargs["unique_key"]
 
     async def inside(*args, **kwargs):
-        if kwargs.get("item"):
-            kwargs["item"].update(consumer_kwargs)
-        else:
-            args[0].update(consumer_kwargs)
+        item = kwargs["item"] if kwargs.get("item") else args[0]
+
+        reason = rules.check_item(item)
+        if reason is not None:
+            logger.debug(f"Skipping {item['path']} ({reason})")
+            return
+
+        item.update(consumer_kwargs)
+        item["rules"] = rules
         signal_handler.start(unique_key)  # finish signal in downloader
 
         await getattr(obj, attr)(*args, **kwargs)
@@ -15,9 +27,10 @@ def queue_wrapper_put(obj, attr, **consumer_kwargs):
 
 
 class QueueWrapper:
-    def __init__(self, queue, signal_handler, unique_key, download_settings, **kwargs):
+    def __init__(self, queue, signal_handler, unique_key, download_settings, rule_kwargs=None, **kwargs):
         kwargs["signal_handler"] = signal_handler
         kwargs["unique_key"] = unique_key
         kwargs["download_settings"] = download_settings
         self.consumer_kwargs = kwargs
-        setattr(self, "put", queue_wrapper_put(queue, "put", **kwargs))
+        self.rules = compile_rules(rule_kwargs or {}, download_settings)
+        setattr(self, "put", queue_wrapper_put(queue, "put", self.rules, **kwargs))
@@ -1,23 +1,35 @@
 import asyncio
 import logging
+import os
+import shutil
 
 import yaml
 
+import core.utils
 from core.exceptions import ParseTemplateError, LoginError
+from core.storage import cache
+from core.template_parser import compiled
 from core.template_parser.constants import POSSIBLE_CONSUMER_KWARGS
 from core.template_parser.nodes import Root, Folder, Site
 from core.template_parser.signal_handler import SignalHandler
 
 logger = logging.getLogger(__name__)
 
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+NODE_TYPES = {
+    "folder": Folder,
+    "site": Site,
+}
+
 
 class Template(object):
     def __init__(self, path, signals=None):
         self.path = path
         self.signal_handler = SignalHandler(signals=signals)
         self.root = Root()
-        self.data = None
         self.nodes = {}
+        self.compiled_nodes = []
 
     def __iter__(self):
         def gen(node):
@@ -28,36 +40,44 @@ class Template(object):
         return gen(self.root)
 
     def load(self):
+        self.compiled_nodes = []
         if self.path is None:
-            self.data = {}
+            self.parse_template({})
         else:
-            self.data = self.load_data(self.path)
-
-        if self.data is None:
-            self.data = {}
-
-        self.parse_template()
+            with open(self.path, "rb") as f:
+                content = f.read()
+
+            key = compiled.get_key(content)
+            compiled_nodes = compiled.load(key)
+            if compiled_nodes is not None:
+                logger.debug(f"Using compiled template of {self.path}")
+                self.build_compiled(compiled_nodes)
+            else:
+                self.parse_template(self.load_data(content))
+                compiled.save(self.path, key, self.compiled_nodes)
 
         self.nodes = {node.unique_key: node for node in iter(self)}
 
-    def load_data(self, path):
-        with open(path) as f:
-            return yaml.load(f, Loader=yaml.Loader)
+    def load_data(self, content):
+        data = yaml.load(content, Loader=YAML_LOADER)
+        if data is None:
+            return {}
+        return data
 
     def save_template(self):
         data = self.root.convert_to_dict()
         try:
             with open(self.path, "w+") as f:
-                yaml.dump(data=data, stream=f, Dumper=yaml.Dumper, default_flow_style=False, sort_keys=False)
+                yaml.dump(data=data, stream=f, Dumper=YAML_DUMPER, default_flow_style=False, sort_keys=False)
         except PermissionError:
             logger.warning(f"Could not save file: {self.path}. Permission Error")
 
     def convert_to_dict(self):
         return self.root.convert_to_dict()
 
-    def parse_template(self):
-        if "children" in self.data:
-            self.parse_children(data=self.data["children"], parent=self.root)
+    def parse_template(self, data):
+        if "children" in data:
+            self.parse_children(data=data["children"], parent=self.root)
 
     def parse_children(self, data, parent):
         for node_dict in data:
@@ -78,17 +98,13 @@ class Template(object):
                 self.parse_children(children, child_node)
 
     def parse_folder(self, data, parent):
-        name = data["folder"]
-
-        meta_data = data.pop("meta_data", None)
-        link_collection = data.pop("link_collection", None)
-
-        folder = Folder(name=name,
-                        meta_data=meta_data,
-                        link_collection=link_collection,
-                        parent=parent)
+        kwargs = dict(
+            name=data["folder"],
+            meta_data=data.pop("meta_data", None),
+            link_collection=data.pop("link_collection", None),
+        )
 
-        return folder
+        return self.create_node("folder", kwargs, parent)
 
     def parse_site(self, p_kwargs, parent):
         raw_module_name = p_kwargs.pop("module")
@@ -104,7 +120,7 @@ class Template(object):
         meta_data = p_kwargs.pop("meta_data", None)
         link_collection = p_kwargs.pop("link_collection", None)
 
-        site = Site(
+        kwargs = dict(
             raw_module_name=raw_module_name,
             use_folder=use_folder,
             raw_folder_name=raw_folder_name,
@@ -115,10 +131,33 @@ class Template(object):
             consumer_kwargs=consumer_kwargs,
             meta_data=meta_data,
             link_collection=link_collection,
-            parent=parent
         )
 
-        return site
+        return self.create_node("site", kwargs, parent)
+
+    def create_node(self, node_type, kwargs, parent):
+        node = NODE_TYPES[node_type](parent=parent, **kwargs)
+
+        if isinstance(node, Site):
+            kwargs = {**kwargs, "resolved_names": node.get_resolved_names()}
+        self.compiled_nodes.append({
+            "type": node_type,
+            "parent": parent.position,
+            "kwargs": kwargs,
+            "kwargs_hash": node.kwargs_hash,
+            "unique_key": node.unique_key,
+        })
+        return node
+
+    def build_compiled(self, compiled_nodes):
+        """Creates the nodes without parsing and validating the template again"""
+        nodes = {self.root.position: self.root}
+        for compiled_node in compiled_nodes:
+            node = NODE_TYPES[compiled_node["type"]](parent=nodes[compiled_node["parent"]],
+                                                     kwargs_hash=compiled_node["kwargs_hash"],
+                                                     unique_key=compiled_node["unique_key"],
+                                                     **compiled_node["kwargs"])
+            nodes[node.position] = node
 
     async def run_root(self, producers, session, queue, download_settings, cancellable_pool):
         await self.run(self.root,
@@ -169,6 +208,50 @@ class Template(object):
                 tasks.append(self.run(child, producers, session, queue, download_settings, cancellable_pool))
         await asyncio.gather(*tasks)
 
+    def move_renamed_folders(self, save_path):
+        """
+        Sites run with their cached folder name and verify it in the background.
+        Moves the folders of the ones, which got a new name, once nothing writes into them anymore.
+        The new name is only cached after the folder was moved, otherwise the next run
+        would download everything again into a new folder
+        """
+        # children first, so their paths are still valid when they are moved
+        for node in reversed(list(self)):
+            if not isinstance(node, Site) or node.renamed_folder_name is None:
+                continue
+
+            folder_name = node.renamed_folder_name
+            node.renamed_folder_name = None
+            new_base_path = core.utils.safe_path_join(node.parent.base_path, folder_name)
+            old_path = os.path.join(save_path, node.base_path)
+            new_path = os.path.join(save_path, new_base_path)
+
+            if os.path.exists(old_path):
+                if os.path.exists(new_path):
+                    logger.warning(f"Could not move {old_path} to {new_path}. The folder already exists")
+                    continue
+
+                logger.info(f"Moving renamed folder {old_path} to {new_path}")
+                try:
+                    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+                    shutil.move(old_path, new_path)
+                except OSError as e:
+                    logger.warning(f"Could not move {old_path} to {new_path}. {type(e).__name__}: {e}")
+                    continue
+
+                cache.move_file_meta_data(old_path, new_path)
+
+            cache.get_json("folder_name")[node.kwargs_hash] = folder_name
+            node.folder_name = folder_name
+            self.signal_handler.update_folder_name(node.unique_key, node.folder_name)
+            self.update_base_paths(node)
+
+    def update_base_paths(self, node):
+        node.base_path = node._init_base_path(node.use_folder)
+        self.signal_handler.update_base_path(node.unique_key, node.base_path)
+        for child in node.children:
+            self.update_base_paths(child)
+
     def add_producer_exception_handler(self, coroutine, node):
         async def wrapper(*args, **kwargs):
             try:
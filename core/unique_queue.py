@@ -1,16 +1,202 @@
 import asyncio
+import collections
+import heapq
+import itertools
+import logging
+
+from yarl import URL
 
 import core.utils
+from core.constants import MOVIE_EXTENSIONS, SCHEDULING_FIFO, SCHEDULING_SMALL_FIRST
+
+logger = logging.getLogger(__name__)
+
+LARGE_FILE_SIZE = 100 * 1024 * 1024
+LARGE_LANE_SLOTS = 1
+MAX_QUEUED_BYTES = 64 * 1024 * 1024
+# producers, which were suspended, continue once the queue is below this part of the limits
+LOW_WATERMARK_RATIO = 0.5
+# the dict and the objects, which aren't shared with other items
+ITEM_OVERHEAD = 1024
+
+
+def get_host(item):
+    return URL(str(item["url"])).host
 
 
-class UniqueQueue(asyncio.Queue):
+def estimate_size(item, size):
+    if size is not None:
+        return size
+    # videos are large, even if the producer doesn't know the size
+    extension = core.utils.get_extension(item["path"]) if item.get("with_extension", True) else None
+    if extension is not None and extension.lower() in MOVIE_EXTENSIONS:
+        return LARGE_FILE_SIZE
+    # unknown sizes keep their order in front of the known large files
+    return 0
+
+
+def estimate_memory(item):
+    return ITEM_OVERHEAD + sum(len(value) for value in item.values() if isinstance(value, str))
+
+
+class HostItems(object):
     def __init__(self):
-        super().__init__()
+        self.small = []
+        self.large = []
+
+    def __len__(self):
+        return len(self.small) + len(self.large)
+
+
+class UniqueQueue(object):
+    """
+    Keeps a queue for every host and hands out items round-robin between
+    the hosts, the ones with a free slot in the controller first. Items don't
+    hold a slot, the downloader only takes one for the transfer, so items of a
+    busy host, which are skipped, don't wait behind its downloads.
+
+    Items can have a 'size' and a 'priority' key, which decide the order
+    inside of a host, if the scheduling isn't SCHEDULING_FIFO. The size
+    stays in the item, the priority is removed.
+
+    put waits, once maxsize items or about max_bytes are queued, until the
+    consumers brought the queue below LOW_WATERMARK_RATIO of both limits.
+    This keeps the producers of large templates from running far ahead of
+    the downloads. A limit of 0 is unlimited.
+    """
+
+    def __init__(self, controller=None, scheduling=SCHEDULING_FIFO, maxsize=0, max_bytes=MAX_QUEUED_BYTES):
         self.paths = {}
+        self.controller = controller
+        self.scheduling = scheduling
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.hosts = collections.OrderedDict()
+        self.active_large = collections.Counter()
+        self.large_items = set()
+        self._counter = itertools.count()
+        self._size = 0
+        self._bytes = 0
+        self._unfinished_tasks = 0
+        self._not_full = asyncio.Event()
+        self._not_full.set()
+        self.suspended_puts = 0
+        self._finished = asyncio.Event()
+        self._finished.set()
+        self._changed = asyncio.Event()
+
+    def qsize(self):
+        return self._size
+
+    def empty(self):
+        return self._size == 0
+
+    def full(self):
+        return (self.maxsize and self._size >= self.maxsize) or (self.max_bytes and self._bytes >= self.max_bytes)
+
+    def _is_below_low_watermark(self):
+        return (not self.maxsize or self._size <= self.maxsize * LOW_WATERMARK_RATIO) and \
+               (not self.max_bytes or self._bytes <= self.max_bytes * LOW_WATERMARK_RATIO)
+
+    def _has_free_slot(self, host):
+        if self.controller is None:
+            return True
+        return self.controller.has_free_slot(host)
+
+    def _get_key(self, item, size, priority):
+        if self.scheduling == SCHEDULING_FIFO:
+            return next(self._counter),
+        return -priority, estimate_size(item, size), next(self._counter)
+
+    def put_nowait(self, item):
+        size = item.get("size", None)
+        priority = item.pop("priority", 0)
+
+        host = get_host(item)
+        if host not in self.hosts:
+            self.hosts[host] = HostItems()
+        host_items = self.hosts[host]
+
+        key = self._get_key(item, size, priority)
+        if self.scheduling == SCHEDULING_SMALL_FIRST and key[1] >= LARGE_FILE_SIZE:
+            heapq.heappush(host_items.large, (key, item))
+        else:
+            heapq.heappush(host_items.small, (key, item))
+
+        self._size += 1
+        self._bytes += estimate_memory(item)
+        self._unfinished_tasks += 1
+        self._finished.clear()
+        self._changed.set()
+        if self.full():
+            self._not_full.clear()
+
+    async def put(self, item):
+        if not self._not_full.is_set():
+            self.suspended_puts += 1
+            await self._not_full.wait()
+        self.put_nowait(item)
+
+    def _pop_from_host(self, host, host_items):
+        # large files always have a lane, but never take more
+        # than that as long as small files are waiting
+        if host_items.large and (not host_items.small or self.active_large[host] < LARGE_LANE_SLOTS):
+            key, item = heapq.heappop(host_items.large)
+            self.active_large[host] += 1
+            self.large_items.add(id(item))
+            return item
+        key, item = heapq.heappop(host_items.small)
+        return item
+
+    def _pop(self):
+        if not self.hosts:
+            return None
+        host = next((host for host in self.hosts if self._has_free_slot(host)), next(iter(self.hosts)))
+        host_items = self.hosts[host]
+
+        item = self._pop_from_host(host, host_items)
+        if host_items:
+            self.hosts.move_to_end(host)
+        else:
+            del self.hosts[host]
+        self._size -= 1
+        self._bytes -= estimate_memory(item)
+        if not self._not_full.is_set() and self._is_below_low_watermark():
+            self._not_full.set()
+        return item
+
+    def get_nowait(self):
+        item = self._pop()
+        if item is None:
+            raise asyncio.QueueEmpty()
+        return self._make_unique(item)
 
     async def get(self):
-        item = await super().get()
+        while True:
+            item = self._pop()
+            if item is not None:
+                return self._make_unique(item)
+            self._changed.clear()
+            await self._changed.wait()
 
+    def task_done(self, item=None):
+        if self._unfinished_tasks <= 0:
+            raise ValueError("task_done() called too many times")
+        if item is not None and id(item) in self.large_items:
+            self.large_items.remove(id(item))
+            self.active_large[get_host(item)] -= 1
+        self._unfinished_tasks -= 1
+        if self._unfinished_tasks == 0:
+            self._finished.set()
+
+    async def join(self):
+        await self._finished.wait()
+
+    def log_stats(self):
+        if self.suspended_puts:
+            logger.debug(f"Producers waited {self.suspended_puts} time(s) for the download queue")
+
+    def _make_unique(self, item):
         path = item["path"]
         with_extension = item.get("with_extension", True)
 
@@ -25,4 +211,3 @@ class UniqueQueue(asyncio.Queue):
 
         self.paths[path] += 1
         return item
-
@@ -16,12 +16,14 @@ from appdirs import user_data_dir
 from bs4 import BeautifulSoup
 
 import settings.settings
-from core.constants import APP_NAME
+from core.constants import APP_NAME, FILE_SIGNATURES
 
 logger = logging.getLogger(__name__)
 
 LATEST_RELEASE_URL = "https://api.github.com/repos/GeorgOhneH/ethz-document-fetcher/releases/latest"
 
+HASH_READ_SIZE = 1024 * 1024
+
 
 async def async_user_statistics(session, name):
     if not name:
@@ -63,13 +65,20 @@ def get_extension_from_response(response):
     if filename is not None:
         return get_extension(filename)
 
-    extension = guess_extension(response.headers['content-type'].partition(';')[0].strip())
+    extension = guess_extension(response.headers.get('content-type', "").partition(';')[0].strip())
     if extension is None:
         return None
 
     return extension[1:]
 
 
+def sniff_extension(data):
+    for offset, signature, extension in FILE_SIGNATURES:
+        if data[offset:offset + len(signature)] == signature:
+            return extension
+    return None
+
+
 def remove_old_files():
     remove_all_temp_files()
     remove_old_log_files()
@@ -120,6 +129,18 @@ def add_extension(file_name, extension):
     return file_name
 
 
+def hash_file(path, algorithms):
+    hashes = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(HASH_READ_SIZE)
+            if not chunk:
+                break
+            for file_hash in hashes.values():
+                file_hash.update(chunk)
+    return {algorithm: file_hash.hexdigest() for algorithm, file_hash in hashes.items()}
+
+
 def safe_path_join(path, *paths):
     return os.path.join(path, *[safe_path(x) for x in paths if x])
 
@@ -10,7 +10,7 @@ from gui.logger import Logger, LoggerSplitter
 from gui.main_window import MainWindow
 from gui.settings import SettingsDialog
 from gui.startup_tasks import run_startup_tasks
-from gui.status_bar_widgets import DownloadSpeedWidget
+from gui.status_bar_widgets import DownloadSpeedWidget, HostLimitsWidget
 from gui.template_edit import TemplateEditDialog
 from gui.template_view import TemplateView
 from gui.worker import WorkerThread
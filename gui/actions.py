@@ -18,6 +18,9 @@ class Actions(QObject):
 
         self.run_checked = QAction("&Run Selected")
 
+        self.plan = QAction("&Plan Run")
+        self.plan.setStatusTip("Check what a run would download, without downloading anything")
+
         self.stop = QAction("&Stop")
         self.stop.setShortcut("Ctrl+C")
 
@@ -39,6 +39,7 @@ class Application(QApplication):
         self.edit_saved.connect(lambda: self._open_file())
 
         self.actions.run.triggered.connect(lambda: self.start_thread())
+        self.actions.plan.triggered.connect(lambda: self.start_thread(plan=True))
         self.actions.stop.triggered.connect(lambda: self.stop_worker())
         self.actions.stop.setEnabled(False)
         self.worker_thread = gui.WorkerThread()
@@ -63,7 +64,7 @@ class Application(QApplication):
         if self.gui_settings.theme:
             self.set_theme(self.gui_settings.theme)
 
-    def start_thread(self, unique_keys=None, recursive=True):
+    def start_thread(self, unique_keys=None, recursive=True, plan=False):
         if unique_keys is None:
             unique_keys = ["root"]
 
@@ -88,7 +89,7 @@ class Application(QApplication):
                     self.actions.edit_file.trigger()
                     return
 
-        if self.download_settings.force_download:
+        if self.download_settings.force_download and not plan:
             msg_box = QMessageBox()
             msg_box.setIcon(QMessageBox.Information)
             msg_box.setWindowTitle("Run Confirmation")
@@ -100,6 +101,7 @@ class Application(QApplication):
 
         self.worker_thread.unique_keys = unique_keys
         self.worker_thread.recursive = recursive
+        self.worker_thread.plan = plan
         self.worker_thread.download_settings = copy.deepcopy(self.download_settings)
         self.worker_thread.template_path = self.get_template_path()
         self.worker_thread.start()
@@ -110,11 +112,13 @@ class Application(QApplication):
     def _thread_started(self):
         self.actions.run.setEnabled(False)
         self.actions.run_checked.setEnabled(False)
+        self.actions.plan.setEnabled(False)
         self.actions.stop.setEnabled(True)
 
     def _thread_finished(self):
         self.actions.run.setEnabled(True)
         self.actions.run_checked.setEnabled(True)
+        self.actions.plan.setEnabled(True)
         self.actions.stop.setEnabled(False)
 
     def open_file(self, file_path=None):
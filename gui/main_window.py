@@ -24,6 +24,7 @@ class MainWindow(QMainWindow):
         status_bar = self.statusBar()
 
         status_bar.showMessage(f"Opened file: {app.get_template_path()}")
+        status_bar.addPermanentWidget(gui.HostLimitsWidget(parent=status_bar))
         status_bar.addPermanentWidget(gui.DownloadSpeedWidget(parent=status_bar))
         app.file_opened.connect(lambda new_template_path:
                                 status_bar.showMessage(f"Opened file: {app.get_template_path()}"))
@@ -56,6 +57,7 @@ class MainWindow(QMainWindow):
         run_menu = menu_bar.addMenu("&Run")
         run_menu.addAction(actions.run)
         run_menu.addAction(actions.run_checked)
+        run_menu.addAction(actions.plan)
         run_menu.addAction(actions.stop)
 
         view_menu = menu_bar.addMenu("&View")
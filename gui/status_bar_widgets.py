@@ -48,3 +48,26 @@ class DownloadSpeedWidget(QWidget):
     def monitor_download_show(self):
         self.set_text()
         self.downloaded_bytes = 0
+
+
+class HostLimitsWidget(QLabel):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.set_stats({})
+
+        app = gui.Application.instance()
+        app.worker_thread.host_limits_changed.connect(self.set_stats)
+        app.worker_thread.started.connect(lambda: self.set_stats({}))
+
+    def set_stats(self, stats):
+        total = sum(host_stats["limit"] for host_stats in stats.values())
+        self.setText(f"Connections: {total}")
+
+        lines = []
+        for host, host_stats in sorted(stats.items()):
+            latency = host_stats["latency"]
+            latency = f"{latency * 1000:.0f} ms" if latency is not None else "-"
+            lines.append(f"{host}: {host_stats['limit']} "
+                         f"({format_bytes(host_stats['throughput'])}/s, {latency}, "
+                         f"{host_stats['errors']} errors, {host_stats['throttled']} throttled)")
+        self.setToolTip("\n".join(lines) if lines else "No downloads yet")
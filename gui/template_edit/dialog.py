@@ -97,7 +97,7 @@ class TemplateEditDialog(QDialog):
 
         try:
             with open(path, "w+") as f:
-                f.write(yaml.dump(template_dict))
+                f.write(yaml.safe_dump(template_dict))
         except Exception as e:
             error_dialog = QErrorMessage(self)
             error_dialog.setWindowTitle("Error")
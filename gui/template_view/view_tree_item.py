@@ -80,19 +80,31 @@ class TreeWidgetItem(QTreeWidgetItem):
         self.setText(self.COLUMN_REPLACED_FILE, str(self.replaced_file_count))
         self.setTextAlignment(self.COLUMN_REPLACED_FILE, Qt.AlignRight | Qt.AlignVCenter)
 
-    def load_from_cache(self, name):
+    def get_cache_table(self, name):
         download_settings = gui.Application.instance().download_settings
         if download_settings.save_path is None:
-            return []
+            return None
         path_name = download_settings.save_path.replace("\\", "").replace("/", "").replace(":", "").replace(
             ".", "")
-        json = cache.get_json(name + path_name)
-        if self.template_node.unique_key not in json:
-            result = []
-            json[self.template_node.unique_key] = result
-            return result
+        return cache.get_json(name + path_name)
+
+    def load_from_cache(self, name):
+        json = self.get_cache_table(name)
+        if json is None:
+            return []
+        with json.lock:
+            return list(json.get(self.template_node.unique_key, []))
 
-        return json[self.template_node.unique_key]
+    def append_to_cache(self, name, value):
+        json = self.get_cache_table(name)
+        if json is None:
+            return
+        # the worker thread commits the table
+        with json.lock:
+            if self.template_node.unique_key not in json:
+                json[self.template_node.unique_key] = []
+            json[self.template_node.unique_key].append(value)
+            json.mark_dirty(self.template_node.unique_key)
 
     def emit_data_changed(self):
         self.treeWidget().emit_item_changed(self, 0)
@@ -179,8 +191,7 @@ class TreeWidgetItem(QTreeWidgetItem):
     def added_new_file(self, path):
         self.added_new_file_count += 1
         self.setText(self.COLUMN_ADDED_FILE, str(self.added_new_file_count))
-        added_files = self.load_from_cache("added_files")
-        added_files.append({
+        self.append_to_cache("added_files", {
             "path": path,
             "timestamp": int(time.time()),
         })
@@ -189,8 +200,7 @@ class TreeWidgetItem(QTreeWidgetItem):
     def replaced_file(self, path, old_path=None, diff_path=None):
         self.replaced_file_count += 1
         self.setText(self.COLUMN_REPLACED_FILE, str(self.replaced_file_count))
-        added_files = self.load_from_cache("added_files")
-        added_files.append({
+        self.append_to_cache("added_files", {
             "path": path,
             "old_path": old_path,
             "diff_path": diff_path,
@@ -7,9 +7,12 @@ import aiohttp
 import certifi
 from PyQt5.QtCore import *
 
-from core import downloader, template_parser, monitor
-from core import unique_queue
+from core import downloader, template_parser, monitor, staging, dedup, concurrency, bandwidth, planner
+from core import unique_queue, local_index
 from core.cancellable_pool import CancellablePool
+from core.http_cache import collect_http_cache
+from core.storage import cache
+from core.storage.utils import collect_function_results
 
 logger = logging.getLogger(__name__)
 
@@ -29,12 +32,14 @@ class WorkerThread(QThread):
     replaced_file = pyqtSignal([str, str, str, str])
 
     downloaded_content_length = pyqtSignal(int)
+    host_limits_changed = pyqtSignal(object)
 
     def __init__(self):
         super().__init__()
 
         self.unique_keys = ["root"]
         self.recursive = True
+        self.plan = False
         self.download_settings = None
         self.template_path = None
 
@@ -46,6 +51,8 @@ class WorkerThread(QThread):
         try:
             start_t = time.time()
             logger.info(f"Starting worker")
+            # a plan must not change the cache
+            cache.set_dry_run(self.plan)
             self.tasks = self.loop.create_task(self._run(self))
             self.loop.run_until_complete(self.tasks)
             logger.info(f"Finished in {(time.time() - start_t):.2f} seconds")
@@ -60,6 +67,8 @@ class WorkerThread(QThread):
                     self.loop.run_until_complete(task)
                 except BaseException as e:
                     pass
+            # drops the changes of a plan
+            cache.set_dry_run(False)
 
     def stop(self):
         if self.tasks is not None:
@@ -72,12 +81,20 @@ class WorkerThread(QThread):
             logger.critical("Settings are not correctly configured.")
             return
 
+        staging.remove_staged_files(self.download_settings.save_path)
+        local_index.build(self.download_settings.save_path)
+        dedup.reset_stats()
+        controller = concurrency.ConcurrencyController(self.download_settings, signals=signals)
+        limiter = bandwidth.create_limiter(self.download_settings)
+
         ssl_context = ssl.create_default_context(cafile=certifi.where())
         conn = aiohttp.TCPConnector(ssl=ssl_context,
                                     limit=self.download_settings.conn_limit,
                                     limit_per_host=self.download_settings.conn_limit_per_host)
         timeout = aiohttp.ClientTimeout(total=30, sock_connect=5)
         async with monitor.MonitorSession(signals=signals,
+                                          controller=controller,
+                                          limiter=limiter,
                                           raise_for_status=True,
                                           connector=conn,
                                           headers={'Connection': 'keep-alive'},
@@ -85,7 +102,9 @@ class WorkerThread(QThread):
 
             try:
                 logger.debug(f"Loading template: {self.template_path}")
-                queue = unique_queue.UniqueQueue()
+                queue = unique_queue.UniqueQueue(controller,
+                                                 self.download_settings.scheduling,
+                                                 maxsize=self.download_settings.queue_size)
                 producers = []
                 cancellable_pool = CancellablePool()
                 template = template_parser.Template(path=self.template_path,
@@ -99,7 +118,16 @@ class WorkerThread(QThread):
                     return
 
                 logger.debug("Starting consumers")
-                consumers = [asyncio.ensure_future(downloader.download_files(session, queue)) for _ in range(20)]
+                if self.plan:
+                    plan = planner.Plan(self.download_settings)
+                    consumers = [asyncio.ensure_future(planner.plan_files(session, queue, plan, controller))
+                                 for _ in range(concurrency.get_consumer_count(self.download_settings))]
+                else:
+                    plan = None
+                    consumers = [asyncio.ensure_future(downloader.download_files(session, queue, controller))
+                                 for _ in range(concurrency.get_consumer_count(self.download_settings))]
+                    # cancelled together with the consumers
+                    consumers.append(asyncio.ensure_future(cache.run_checkpoints()))
 
                 await template.run_from_unique_keys(self.unique_keys,
                                                     producers=producers,
@@ -115,6 +143,25 @@ class WorkerThread(QThread):
                 logger.debug("Waiting for queue")
                 await queue.join()
 
+                if plan is None:
+                    template.move_renamed_folders(self.download_settings.save_path)
+
+                dedup.log_stats()
+                queue.log_stats()
+                controller.log_stats()
+                session.response_cache.log_stats()
+                if plan is None:
+                    cache.enforce_policies()
+                    collect_function_results()
+                    collect_http_cache()
+                cache.log_stats()
+
+                if plan is not None:
+                    plan_path = planner.get_plan_path()
+                    plan.save(plan_path)
+                    plan.log_summary()
+                    logger.info(f"Saved plan to {plan_path}")
+
             except asyncio.CancelledError:
                 return
 
@@ -130,8 +177,10 @@ class WorkerThread(QThread):
                 for c in consumers:
                     c.cancel()
 
+                cache.commit()
+
                 logger.debug("Clearing queue")
                 while not queue.empty():
                     item = queue.get_nowait()
-                    queue.task_done()
+                    queue.task_done(item)
                     signals.site_finished[str].emit(item["unique_key"])
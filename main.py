@@ -9,18 +9,21 @@ import aiohttp
 import certifi
 import colorama
 
-from core import downloader, template_parser, monitor
-from core import unique_queue
+from core import downloader, template_parser, monitor, staging, dedup, concurrency, bandwidth, planner
+from core import unique_queue, local_index
 from core.cancellable_pool import CancellablePool
 from core.constants import VERSION
+from core.http_cache import collect_http_cache
+from core.storage import cache
+from core.storage.utils import collect_function_results
 from core.utils import async_user_statistics, async_get_latest_version, remove_old_files
 from settings.logger import setup_logger
-from settings.settings import DownloadSettings, TemplatePathSettings, BehaviorSettings
+from settings.settings import DownloadSettings, TemplatePathSettings, BehaviorSettings, Settings
 
 logger = logging.getLogger(__name__)
 
 
-async def main(signals=None, download_settings=None):
+async def main(signals=None, download_settings=None, plan_path=None):
     behavior_settings = BehaviorSettings()
     setup_logger(behavior_settings.loglevel)
 
@@ -35,6 +38,13 @@ async def main(signals=None, download_settings=None):
         return
 
     remove_old_files()
+    # a plan must not change the cache
+    cache.set_dry_run(plan_path is not None)
+    staging.remove_staged_files(download_settings.save_path)
+    local_index.build(download_settings.save_path)
+    dedup.reset_stats()
+    controller = concurrency.ConcurrencyController(download_settings, signals=signals)
+    limiter = bandwidth.create_limiter(download_settings)
 
     ssl_context = ssl.create_default_context(cafile=certifi.where())
     conn = aiohttp.TCPConnector(ssl=ssl_context,
@@ -42,12 +52,16 @@ async def main(signals=None, download_settings=None):
                                 limit_per_host=download_settings.conn_limit_per_host)
     timeout = aiohttp.ClientTimeout(total=30, sock_connect=5)
     async with monitor.MonitorSession(signals=signals,
+                                      controller=controller,
+                                      limiter=limiter,
                                       raise_for_status=True,
                                       connector=conn,
                                       headers={'Connection': 'keep-alive'},
                                       timeout=timeout) as session:
         logger.debug(f"Loading template: {template_path}")
-        queue = unique_queue.UniqueQueue()
+        queue = unique_queue.UniqueQueue(controller,
+                                         download_settings.scheduling,
+                                         maxsize=download_settings.queue_size)
         producers = []
         cancellable_pool = CancellablePool()
         template_file = os.path.join(os.path.dirname(__file__), template_path)
@@ -74,7 +88,16 @@ async def main(signals=None, download_settings=None):
                         f" New version: {latest_version}. Current version {VERSION}")
 
         logger.debug("Starting consumers")
-        consumers = [asyncio.ensure_future(downloader.download_files(session, queue)) for _ in range(20)]
+        if plan_path is None:
+            plan = None
+            consumers = [asyncio.ensure_future(downloader.download_files(session, queue, controller))
+                         for _ in range(concurrency.get_consumer_count(download_settings))]
+            # cancelled together with the consumers
+            consumers.append(asyncio.ensure_future(cache.run_checkpoints()))
+        else:
+            plan = planner.Plan(download_settings)
+            consumers = [asyncio.ensure_future(planner.plan_files(session, queue, plan, controller))
+                         for _ in range(concurrency.get_consumer_count(download_settings))]
 
         logger.debug("Gathering producers")
         await asyncio.gather(*producers)
@@ -92,17 +115,51 @@ async def main(signals=None, download_settings=None):
 
         cancellable_pool.shutdown()
 
+        if plan is None:
+            template.move_renamed_folders(download_settings.save_path)
+
+        dedup.log_stats()
+        queue.log_stats()
+        controller.log_stats()
+        session.response_cache.log_stats()
+        if plan is None:
+            cache.enforce_policies()
+            collect_function_results()
+            collect_http_cache()
+        cache.log_stats()
+        cache.commit()
+
+        if plan is not None:
+            plan.save(plan_path)
+            plan.log_summary()
+            logger.info(f"Saved plan to {os.path.abspath(plan_path)}")
+
         await user_statistic
 
 
+def prune_cache():
+    setup_logger(BehaviorSettings().loglevel)
+    template_file = os.path.join(os.path.dirname(__file__), TemplatePathSettings().template_path)
+    template = template_parser.Template(path=template_file)
+    template.load()
+
+    removed = cache.prune({node.kwargs_hash for node in template})
+    for name, count in removed.items():
+        logger.info(f"Removed {count} entries from {name}")
+
+
 if __name__ == '__main__':
     freeze_support()
     colorama.init()
 
-    start_t = time.time()
-    startup_time = time.process_time()
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(main())
-    logger.debug(f"Startup time: {startup_time:.2f} seconds")
-    logger.debug(f"Total process time: {(time.process_time()):.2f} seconds")
-    logger.info(f"Finished in {(time.time() - start_t):.2f} seconds")
+    args = Settings.parser.parse_args()
+    if args.prune_cache:
+        prune_cache()
+    else:
+        start_t = time.time()
+        startup_time = time.process_time()
+        loop = asyncio.get_event_loop()
+        loop.run_until_complete(main(plan_path=args.plan))
+        logger.debug(f"Startup time: {startup_time:.2f} seconds")
+        logger.debug(f"Total process time: {(time.process_time()):.2f} seconds")
+        logger.info(f"Finished in {(time.time() - start_t):.2f} seconds")
@@ -3,6 +3,7 @@ import logging
 import os
 
 import settings.utils
+from core.constants import ALL_DEDUP_METHODS, DEDUP_OFF, ALL_SCHEDULING_MODES, SCHEDULING_SMALL_FIRST
 from gui.constants import ALL_THEMES, THEME_NATIVE, SITES_URL
 from settings.config import ConfigBase, Configs
 from settings.config_objs import ConfigPath, ConfigListString, ConfigBool, ConfigPassword, \
@@ -22,6 +23,10 @@ def get_key_value(f):
 class SettingBase(ConfigBase):
     argument_parser = argparse.ArgumentParser()
     argument_parser.add_argument("--app-data-path")
+    argument_parser.add_argument("--plan", nargs="?", const="plan.json", metavar="PATH",
+                                 help="Only write a plan of what would be downloaded to PATH")
+    argument_parser.add_argument("--prune-cache", action="store_true",
+                                 help="Remove expired cache entries and the ones of sites, which are not in the template")
 
     def __new__(mcs, name, bases, attrs, **kwargs):
         cls = super().__new__(mcs, name, bases, attrs, **kwargs)
@@ -124,6 +129,39 @@ class DownloadSettings(Settings):
                                           hint_text="Add 'video' for all video types.")
     forbidden_extensions = ConfigListString(default=[], optional=True, gui_name="Forbidden Extensions",
                                             hint_text="Add 'video' for all video types.")
+    max_file_size = ConfigInt(minimum=0, default=0, gui_name="Maximum File Size (MB)",
+                              hint_text="Larger files are skipped. 0 for unlimited")
+    resume_downloads = ConfigBool(default=True,
+                                  gui_name="Resume Interrupted Downloads",
+                                  hint_text="Keeps the already downloaded part of an interrupted file "
+                                            "and continues it on the next run, if the server supports it.")
+    segmented_download_size = ConfigInt(minimum=0, default=50,
+                                        gui_name="Segmented Download Threshold (MB)",
+                                        hint_text="Files above this size are downloaded over multiple "
+                                                  "connections, if the server supports it. 0 to disable")
+    deduplication = ConfigOptions(default=DEDUP_OFF,
+                                  options=ALL_DEDUP_METHODS,
+                                  gui_name="Deduplicate identical Files",
+                                  hint_text="Files with the same content share their storage. Reflinks are "
+                                            "copy-on-write, hardlinks also share later edits.<br>"
+                                            "If the filesystem supports neither, the files are kept as copies.")
+    scheduling = ConfigOptions(default=SCHEDULING_SMALL_FIRST,
+                               options=ALL_SCHEDULING_MODES,
+                               gui_name="Download Order",
+                               hint_text="Which files are downloaded first, if the size is known. "
+                                         "'small files first' keeps one connection per host "
+                                         "for large files and videos.")
+    bandwidth_limit = ConfigInt(minimum=0, default=0, gui_name="Bandwidth Limit (KB/s)",
+                                hint_text="0 for unlimited")
+    host_bandwidth_limits = ConfigListString(default=[], optional=True, gui_name="Bandwidth Limits per Host",
+                                             hint_text="Format: 'host=KB/s', e.g. 'polybox.ethz.ch=1000'")
+    bandwidth_profiles = ConfigListString(default=[], optional=True, gui_name="Bandwidth Limits by Time",
+                                          hint_text="Format: 'HH:MM-HH:MM=KB/s', e.g. '08:00-18:00=500'. "
+                                                    "Replaces the bandwidth limit during this time, "
+                                                    "0 for unlimited.")
+    queue_size = ConfigInt(minimum=0, default=10000, gui_name="Maximum Number of Queued Files",
+                           hint_text="Sites wait with finding more files, once this many are waiting "
+                                     "for the download. 0 for unlimited")
     conn_limit = ConfigInt(minimum=0, default=50, gui_name="Maximum Number of Connections",
                            hint_text="0 for unlimited")
     conn_limit_per_host = ConfigInt(minimum=0, default=5, gui_name="Maximum Number of Connections per Host",
@@ -1 +1,17 @@
 POSSIBLE_LOGIN_FUNCTIONS = ["custom", "link_collector", "nethz"]
+
+# the functions every site module provides, so templates can be validated
+# without importing the sites. Has to be updated with the sites
+SITE_ENTRY_POINTS = {
+    "sites.aai_logon": {"login"},
+    "sites.custom": set(),
+    "sites.dropbox": {"producer", "get_folder_name", "get_website_url"},
+    "sites.google_drive": {"producer", "get_folder_name", "get_website_url"},
+    "sites.ilias": {"producer", "get_folder_name", "get_website_url", "login"},
+    "sites.link_collector": {"producer", "get_folder_name", "get_website_url"},
+    "sites.moodle": {"producer", "get_folder_name", "get_website_url", "login"},
+    "sites.nethz": {"producer", "get_folder_name", "get_website_url"},
+    "sites.one_drive": {"producer", "get_folder_name", "get_website_url"},
+    "sites.polybox": {"producer", "get_folder_name", "get_website_url", "parse_single_file"},
+    "sites.video_portal": {"producer", "get_folder_name", "get_website_url"},
+}
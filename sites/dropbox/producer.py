@@ -1,4 +1,3 @@
-import asyncio
 from urllib.parse import urlparse
 
 from core.utils import safe_path_join
@@ -45,35 +44,38 @@ async def producer(session, queue, base_path, download_settings, url: URL_CONFIG
 
     cut_path = len([x for x in sub_path.split("/") if x.strip() != ""])
 
-    await parse_folder(session,
-                       queue,
-                       base_path,
-                       download_settings,
-                       key,
-                       secure_hash,
-                       sub_path=sub_path,
-                       cut_path_num=cut_path)
-
-
-async def parse_folder(session, queue, base_path, download_settings, key, secure_hash, sub_path, cut_path_num=0):
+    crawler = session.crawler
+    await crawler.run(parse_folder,
+                      crawler,
+                      session,
+                      queue,
+                      base_path,
+                      download_settings,
+                      key,
+                      secure_hash,
+                      sub_path=sub_path,
+                      cut_path_num=cut_path)
+
+
+async def parse_folder(crawler, session, queue, base_path, download_settings, key, secure_hash, sub_path,
+                       cut_path_num=0):
     data = _get_data(key, secure_hash, sub_path)
 
     async with session.post(LIST_ENTRIES_URL, cookies=DEFAULT_COOKIE, data=data) as response:
         result = await response.json()
 
-    tasks = []
-
     for entry, share_tokens in zip(result["entries"], result["share_tokens"]):
         if entry["is_dir"]:
-            coroutine = parse_folder(session=session,
-                                     queue=queue,
-                                     base_path=base_path,
-                                     download_settings=download_settings,
-                                     key=share_tokens["linkKey"],
-                                     secure_hash=share_tokens["secureHash"],
-                                     sub_path=share_tokens["subPath"],
-                                     cut_path_num=cut_path_num)
-            tasks.append(asyncio.create_task(coroutine))
+            await crawler.spawn(parse_folder,
+                                crawler=crawler,
+                                session=session,
+                                queue=queue,
+                                base_path=base_path,
+                                download_settings=download_settings,
+                                key=share_tokens["linkKey"],
+                                secure_hash=share_tokens["secureHash"],
+                                sub_path=share_tokens["subPath"],
+                                cut_path_num=cut_path_num)
             continue
 
         checksum = entry["sjid"]
@@ -88,5 +90,3 @@ async def parse_folder(session, queue, base_path, download_settings, key, secure
                          "path": path,
                          "checksum": checksum,
                          })
-
-    await asyncio.gather(*tasks)
@@ -1,5 +1,3 @@
-import asyncio
-
 from core.utils import safe_path_join
 from settings.config import ConfigString
 from .constants import *
@@ -21,35 +19,34 @@ def _get_file_url(file_id):
 def _get_folder_params(file_id):
     return {
         "q": f"'{file_id}' in parents",
-        "fields": "nextPageToken,files(name,size,id,mimeType,modifiedTime)",
+        "fields": "nextPageToken,files(name,size,id,mimeType,modifiedTime,md5Checksum)",
         "pageSize": "1000",
         **DEFAULT_PARAMS
     }
 
 
-async def parse_folder(session, queue, base_path, file_id):
+async def parse_folder(crawler, session, queue, base_path, file_id):
     params = _get_folder_params(file_id)
 
-    async with session.get(FOLDER_URL, params=params, headers=REFERER_HEADERS) as response:
+    async with session.get_cached(FOLDER_URL, persistent=True, params=params, headers=REFERER_HEADERS) as response:
         data = await response.json()
 
     files = data["files"]
     while "nextPageToken" in data:
         page_params = {"pageToken": data["nextPageToken"], **params}
-        async with session.get(FOLDER_URL, params=page_params, headers=REFERER_HEADERS) as response:
+        async with session.get_cached(FOLDER_URL, persistent=True, params=page_params,
+                                      headers=REFERER_HEADERS) as response:
             data = await response.json()
         files += data["files"]
 
-    tasks = []
     for file in files:
         path = safe_path_join(base_path, file["name"])
         if file["mimeType"] == MIMETYPE_FOLDER:
-            tasks.append(parse_folder(session, queue, path, file["id"]))
-
-    await asyncio.gather(*tasks)
+            await crawler.spawn(parse_folder, crawler, session, queue, path, file["id"])
 
     for file in files:
         with_extension = False
+        content_hashes = None
         path = safe_path_join(base_path, file["name"])
 
         if file["mimeType"] == MIMETYPE_GOOGLE_DOCS:
@@ -74,10 +71,14 @@ async def parse_folder(session, queue, base_path, file_id):
             url = "https://drive.google.com/uc"
             params = _get_download_params(file["id"])
             with_extension = True
+            if "md5Checksum" in file:
+                content_hashes = {"md5": file["md5Checksum"]}
 
         await queue.put({"url": url,
                          "path": path,
                          "checksum": file["modifiedTime"],
+                         "content_hashes": content_hashes,
+                         "size": int(file["size"]) if "size" in file else None,
                          "session_kwargs": {"params": params},
                          "with_extension": with_extension,
                          })
@@ -88,7 +89,8 @@ async def producer(session,
                    base_path,
                    download_settings,
                    file_id: GDRIVE_ID_CONFIG):
-    await parse_folder(session, queue, base_path, file_id)
+    crawler = session.crawler
+    await crawler.run(parse_folder, crawler, session, queue, base_path, file_id)
 
 
 async def get_folder_name(session, file_id, **kwargs):
@@ -2,11 +2,11 @@ import asyncio
 import datetime
 import re
 
-import aiohttp
 from babel.dates import format_datetime
 from bs4 import BeautifulSoup, SoupStrainer
 
 from core.exceptions import LoginError
+from core.monitor import MonitorSession
 from core.utils import get_beautiful_soup_parser, safe_path_join
 from settings.config import ConfigString
 from sites.ilias import login
@@ -18,7 +18,7 @@ ILIAS_ID_CONFIG = ConfigString(gui_name="ID")
 
 async def get_folder_name(session, ilias_id, **kwargs):
     url = GOTO_URL + str(ilias_id)
-    async with session.get(url) as response:
+    async with session.get_cached(url) as response:
         html = await response.text()
 
     soup = BeautifulSoup(html, get_beautiful_soup_parser())
@@ -29,12 +29,13 @@ async def get_folder_name(session, ilias_id, **kwargs):
 
 
 async def producer(session, queue, base_path, download_settings, ilias_id: ILIAS_ID_CONFIG):
-    await search_tree(session, queue, base_path, download_settings, ilias_id)
+    crawler = session.crawler
+    await crawler.run(search_tree, crawler, session, queue, base_path, download_settings, ilias_id)
 
 
-async def search_tree(session, queue, base_path, download_settings, ilias_id):
+async def search_tree(crawler, session, queue, base_path, download_settings, ilias_id):
     url = GOTO_URL + str(ilias_id)
-    async with session.get(url) as response:
+    async with session.get_cached(url) as response:
         html = await response.text()
         if str(response.url) != url:
             raise LoginError("Module ilias isn't logged in or you are not allowed to access these files")
@@ -42,7 +43,6 @@ async def search_tree(session, queue, base_path, download_settings, ilias_id):
     strainer = SoupStrainer("div", attrs={"class": "ilCLI ilObjListRow row"})
     soup = BeautifulSoup(html, get_beautiful_soup_parser(), parse_only=strainer)
     rows = soup.find_all("div", attrs={"class": "ilCLI ilObjListRow row"})
-    tasks = []
     for row in rows:
         content = row.find("div", attrs={"class": "ilContainerListItemContent"})
         link = content.find("a")
@@ -68,15 +68,12 @@ async def search_tree(session, queue, base_path, download_settings, ilias_id):
             await queue.put({"url": href, "path": f"{path}.{extension}", "checksum": checksum})
         else:
             ref_id = re.search("ref_id=([0-9]+)&", href).group(1)
-            coroutine = search_tree(session, queue, path, download_settings, ref_id)
-            tasks.append(asyncio.ensure_future(coroutine))
-
-    await asyncio.gather(*tasks)
+            await crawler.spawn(search_tree, crawler, session, queue, path, download_settings, ref_id)
 
 
 if __name__ == "__main__":
     async def main():
-        async with aiohttp.ClientSession(raise_for_status=True) as session:
+        async with MonitorSession(signals=None, raise_for_status=True) as session:
             await login(session)
             await get_folder_name(session, "187834")
 
@@ -121,7 +121,7 @@ def _get_file_name(guess_extension: str,
 
 
 async def get_all_file_links(session, url, session_kwargs):
-    async with session.get(url, **session_kwargs) as response:
+    async with session.get_cached(url, **session_kwargs) as response:
         html = await response.text()
 
     all_links = dict()
@@ -147,7 +147,7 @@ async def get_all_file_links(session, url, session_kwargs):
 
 
 async def get_folder_name(session, url, **kwargs):
-    async with session.get(url) as response:
+    async with session.get_cached(url) as response:
         html = await response.text()
     soup = BeautifulSoup(html, get_beautiful_soup_parser())
     title = soup.find("title")
@@ -112,7 +112,7 @@ async def parse_single_section(session,
                                process_external_links,
                                keep_file_order,
                                password_mapper):
-    async with session.get(href) as response:
+    async with session.get_cached(href, persistent=True) as response:
         html = await response.read()
 
     section_id = re.search(r"&section=([0-9]+)", href).group(1)
@@ -226,17 +226,17 @@ async def parse_module(session,
         last_updated = last_updated_dict[module_id]
         name = str(link.span.contents[0])
 
-        assign_file_tree_soup_soup = await call_function_or_cache(get_assign_files_tree,
-                                                                  last_updated,
-                                                                  session,
-                                                                  href)
+        assign_files = await call_function_or_cache(get_assign_files, last_updated, session, href)
 
         if keep_file_order:
             name = f"[{module_idx + 1:02}] {name}"
 
-        await parse_assign_files_tree(queue=queue,
-                                      soup=assign_file_tree_soup_soup,
-                                      path=safe_path_join(base_path, name))
+        for file in assign_files:
+            await queue.put({
+                "path": safe_path_join(base_path, name, file["name"]),
+                "url": file["url"],
+                "checksum": file["checksum"],
+            })
     elif mtype == MTYPE_LABEL:
         if not process_external_links:
             return
@@ -261,76 +261,76 @@ async def parse_module(session,
                                password_mapper=password_mapper)
 
 
-async def get_filemanager(session, href):
+async def get_filemanager_files(session, href):
     async with session.get(href) as response:
         text = await response.text()
 
     only_file_tree = SoupStrainer("div", id=re.compile("folder_tree[0-9]+"), class_="filemanager")
-    return BeautifulSoup(text, get_beautiful_soup_parser(), parse_only=only_file_tree)
+    soup = BeautifulSoup(text, get_beautiful_soup_parser(), parse_only=only_file_tree)
+
+    files = []
+    for folder_tree in soup.find_all("div", id=re.compile("folder_tree[0-9]+"), class_="filemanager"):
+        files += get_folder_tree_files(folder_tree.ul)
+    return files
 
 
-async def get_assign_files_tree(session, href):
+async def get_assign_files(session, href):
     async with session.get(href) as response:
         text = await response.text()
 
-    assign_files_tree = SoupStrainer("div", id=re.compile("assign_files_tree[0-9a-f]*"))
-    return BeautifulSoup(text, get_beautiful_soup_parser(), parse_only=assign_files_tree)
+    only_assign_files_tree = SoupStrainer("div", id=re.compile("assign_files_tree[0-9a-f]*"))
+    soup = BeautifulSoup(text, get_beautiful_soup_parser(), parse_only=only_assign_files_tree)
+
+    files = []
+    for assign_files_tree in soup.find_all("div", id=re.compile("assign_files_tree[0-9a-f]*")):
+        for item in assign_files_tree.ul.find_all("li", recursive=False):
+            date_time = str(item.find("div", class_="fileuploadsubmissiontime").string)
+            fileuploadsubmission_soup = item.find("div", class_="fileuploadsubmission")
+            files.append({
+                "name": str(fileuploadsubmission_soup.a.string),
+                "url": fileuploadsubmission_soup.a["href"],
+                "checksum": date_time,
+            })
+    return files
 
 
 async def parse_folder(session, queue, download_settings, module, base_path, last_updated):
     folder_tree = module.find("div", id=re.compile("folder_tree[0-9]+"), class_="filemanager")
     if folder_tree is not None:
-        await parse_folder_tree(queue, folder_tree.ul, base_path, last_updated)
-        return
-
-    link = module.find("a")
-    folder_name = str(link.span.contents[0])
-    folder_path = safe_path_join(base_path, folder_name)
-
-    href = link["href"]
-
-    folder_soup = await call_function_or_cache(get_filemanager, last_updated, session, href)
+        files = get_folder_tree_files(folder_tree.ul)
+        folder_path = base_path
+    else:
+        link = module.find("a")
+        folder_name = str(link.span.contents[0])
+        folder_path = safe_path_join(base_path, folder_name)
 
-    await parse_sub_folders(queue, folder_soup, folder_path, last_updated)
+        href = link["href"]
 
+        files = await call_function_or_cache(get_filemanager_files, last_updated, session, href)
 
-async def parse_sub_folders(queue, soup, folder_path, last_updated):
-    folder_trees = soup.find_all("div", id=re.compile("folder_tree[0-9]+"), class_="filemanager")
-    for folder_tree in folder_trees:
-        await parse_folder_tree(queue, folder_tree.ul, folder_path, last_updated)
+    for file in files:
+        item = {"path": safe_path_join(folder_path, *file["path"]), "url": file["url"], "checksum": last_updated}
+        await queue.put(item)
 
 
-async def parse_folder_tree(queue, soup, folder_path, last_updated):
+def get_folder_tree_files(soup, sub_folders=()):
+    """Returns the files of the tree with their path as a list of the folder names, so they can be cached as json"""
+    files = []
     children = soup.find_all("li", recursive=False)
     for child in children:
         if child.find("div", recursive=False) is not None:
-            sub_folder_path = safe_path_join(folder_path, child.div.span.img["alt"])
+            child_sub_folders = [*sub_folders, child.div.span.img["alt"]]
         else:
-            sub_folder_path = folder_path
+            child_sub_folders = sub_folders
 
         if child.find("ul", recursive=False) is not None:
-            await parse_folder_tree(queue, child.ul, sub_folder_path, last_updated)
+            files += get_folder_tree_files(child.ul, child_sub_folders)
 
         if child.find("span", recursive=False) is not None:
             url = child.span.a["href"]
             name = child.span.a.find("span", recursive=False, class_="fp-filename").get_text(strip=True)
-            item = {"path": safe_path_join(sub_folder_path, name), "url": url, "checksum": last_updated}
-            await queue.put(item)
-
-
-async def parse_assign_files_tree(queue, soup, path):
-    for assign_files_tree in soup.find_all("div", id=re.compile("assign_files_tree[0-9a-f]*")):
-        for item in assign_files_tree.ul.find_all("li", recursive=False):
-            date_time = str(item.find("div", class_="fileuploadsubmissiontime").string)
-            fileuploadsubmission_soup = item.find("div", class_="fileuploadsubmission")
-            name = str(fileuploadsubmission_soup.a.string)
-            url = fileuploadsubmission_soup.a["href"]
-
-            await queue.put({
-                "path": safe_path_join(path, name),
-                "url": url,
-                "checksum": date_time,
-            })
+            files.append({"path": [*child_sub_folders, name], "url": url})
+    return files
 
 
 async def get_update_json(session, moodle_id, sesskey):
@@ -44,7 +44,7 @@ async def producer(session,
                    keep_section_order: KEEP_SECTION_ORDER_CONFIG = False,
                    keep_file_order: KEEP_FILE_ORDER_CONFIG = False,
                    password_mapper: PASSWORD_MAPPER_CONFIG = None):
-    async with session.get(f"https://moodle-app2.let.ethz.ch/course/view.php?id={moodle_id}") as response:
+    async with session.get_cached(f"https://moodle-app2.let.ethz.ch/course/view.php?id={moodle_id}") as response:
         html = await response.read()
         if str(response.url) == AUTH_URL:
             raise LoginError("Module moodle isn't logged in")
@@ -61,7 +61,7 @@ async def producer(session,
 
 
 async def get_folder_name(session, moodle_id, **kwargs):
-    async with session.get(f"https://moodle-app2.let.ethz.ch/course/view.php?id={moodle_id}") as response:
+    async with session.get_cached(f"https://moodle-app2.let.ethz.ch/course/view.php?id={moodle_id}") as response:
         html = await response.read()
     soup = BeautifulSoup(html, get_beautiful_soup_parser())
 
@@ -1,4 +1,3 @@
-import asyncio
 import re
 from urllib.parse import unquote
 
@@ -12,7 +11,7 @@ URL_CONFIG = ConfigString(gui_name="Url")
 
 
 async def get_folder_name(session, url, **kwargs):
-    async with session.get(url) as response:
+    async with session.get_cached(url) as response:
         html = await response.text()
     soup = BeautifulSoup(html, get_beautiful_soup_parser())
 
@@ -24,20 +23,20 @@ async def get_folder_name(session, url, **kwargs):
 
 async def producer(session, queue, base_path, download_settings, url: URL_CONFIG, basic_auth: BASIC_AUTH_CONFIG):
     session_kwargs = basic_auth_config_to_session_kwargs(basic_auth, download_settings)
-    await _producer(session, queue, url, base_path, session_kwargs)
+    crawler = session.crawler
+    await crawler.run(_producer, crawler, session, queue, url, base_path, session_kwargs)
 
 
-async def _producer(session, queue, url, base_path, session_kwargs):
+async def _producer(crawler, session, queue, url, base_path, session_kwargs):
     if url[-1] != "/":
         url += "/"
 
-    async with session.get(url, **session_kwargs) as response:
+    async with session.get_cached(url, **session_kwargs) as response:
         html = await response.text()
 
     soup = BeautifulSoup(html, get_beautiful_soup_parser())
 
     links = soup.find_all("a")
-    tasks = []
     for link in links:
         href = link.get("href")
         if unquote(href) != str(link.string).strip():
@@ -55,7 +54,4 @@ async def _producer(session, queue, url, base_path, session_kwargs):
                              "session_kwargs": session_kwargs,
                              "checksum": checksum})
         else:
-            coroutine = _producer(session, queue, url + href, path, session_kwargs)
-            tasks.append(asyncio.ensure_future(coroutine))
-
-    await asyncio.gather(*tasks)
+            await crawler.spawn(_producer, crawler, session, queue, url + href, path, session_kwargs)
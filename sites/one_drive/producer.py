@@ -36,35 +36,36 @@ async def get_folder_name(session, url, **kwargs):
 
 
 async def producer(session, queue, base_path, download_settings, url: URL_CONFIG):
-    await _producer(session, queue, base_path, download_settings, url)
+    crawler = session.crawler
+    await crawler.run(_producer, crawler, session, queue, base_path, download_settings, url)
 
 
-async def _producer(session, queue, base_path, download_settings, url, etag=None):
+async def _producer(crawler, session, queue, base_path, download_settings, url, etag=None):
     parameters = parse_qs(urlparse(url).query)
     api_url = get_api_url(parameters, children=True)
     authkey = parameters['authkey'][0]
 
     item_data = await call_function_or_cache(get_json_response, etag, session, api_url)
 
-    tasks = []
     for item in item_data["value"]:
         path = safe_path_join(base_path, item["name"])
         if "@content.downloadUrl" in item:
             checksum = item["file"]["hashes"]["sha256Hash"]
-            await queue.put({"path": path, "url": item["@content.downloadUrl"], "checksum": checksum})
+            await queue.put({"path": path,
+                             "url": item["@content.downloadUrl"],
+                             "checksum": checksum,
+                             "content_hashes": {"sha256": checksum},
+                             "size": item.get("size", None)})
 
         elif "folder" in item:
             folder_url = await check_url_reference(session, item['webUrl']) + f"?authkey={authkey}"
             item_etag = item["lastModifiedDateTime"]
-            coroutine = _producer(session, queue, path, download_settings, f"{folder_url}?authkey={authkey}",
-                                  etag=item_etag)
-            tasks.append(asyncio.ensure_future(coroutine))
-
-    await asyncio.gather(*tasks)
+            await crawler.spawn(_producer, crawler, session, queue, path, download_settings,
+                                f"{folder_url}?authkey={authkey}", etag=item_etag)
 
 
 async def get_json_response(session, api_url):
-    async with session.get(api_url) as response:
+    async with session.get_cached(api_url, persistent=True) as response:
         return await response.json()
 
 
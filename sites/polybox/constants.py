@@ -3,6 +3,7 @@ PROPFIND_DATA = """<?xml version="1.0"?>
     <a:prop xmlns:oc="http://owncloud.org/ns">
         <oc:checksums/>
         <a:getcontenttype/>
+        <a:getcontentlength/>
     </a:prop>
 </a:propfind>"""
 
@@ -57,7 +57,10 @@ async def _get_dire_path(session, download_settings, poly_type, poly_id):
 async def get_folder_name(session, download_settings, poly_id, poly_type="s", password=None):
     # We create a new session, because polybox doesn't work
     # when you jump around with the same session
-    async with MonitorSession(raise_for_status=True, signals=session.signals) as session:
+    async with MonitorSession(raise_for_status=True,
+                              signals=session.signals,
+                              controller=session.controller,
+                              limiter=session.limiter) as session:
         if poly_type == "s":
             return await _get_folder_name_s(session=session,
                                             poly_type=poly_type,
@@ -173,6 +176,7 @@ async def _parse_tree(session, queue, base_path, url, auth, cut_parts_num=3):
         contenttype = go_down_tree(prop, "d:getcontenttype", to_text=True)
         if contenttype is None:
             continue
+        contentlength = go_down_tree(prop, "d:getcontentlength", to_text=True)
 
         path = PurePath(unquote(href))
         path = safe_path_join("", *path.parts[cut_parts_num:])
@@ -186,12 +190,27 @@ async def _parse_tree(session, queue, base_path, url, auth, cut_parts_num=3):
         await queue.put({"url": url,
                          "path": absolute_path,
                          "checksum": checksum,
+                         "content_hashes": parse_checksums(checksum),
+                         "size": int(contentlength) if contentlength else None,
                          "session_kwargs": {"auth": auth},
                          })
 
     await asyncio.gather(*tasks)
 
 
+def parse_checksums(checksum):
+    # looks like: "SHA1:... MD5:... ADLER32:..."
+    if checksum is None:
+        return None
+
+    result = {}
+    for part in checksum.split():
+        algorithm, _, value = part.partition(":")
+        if value:
+            result[algorithm.lower()] = value.lower()
+    return result
+
+
 def go_down_tree(tree, *args, to_text=False):
     if tree is None:
         return None
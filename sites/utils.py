@@ -1,7 +1,6 @@
 import logging
 import re
 
-from core.downloader import is_extension_forbidden
 from sites import zoom, polybox
 
 logger = logging.getLogger(__name__)
@@ -25,19 +24,7 @@ async def process_single_file_url(session, queue, base_path, download_settings,
     elif "zoom.us/rec/play" in url or "zoom.us/rec/share" in url:
         # TODO: fix zoom
         return
-        allowed_extensions = []
-        if download_settings.allowed_extensions:
-            allowed_extensions += download_settings.allowed_extensions
-        if queue.consumer_kwargs["allowed_extensions"]:
-            allowed_extensions += queue.consumer_kwargs["allowed_extensions"]
-
-        forbidden_extensions = []
-        if download_settings.forbidden_extensions:
-            forbidden_extensions += download_settings.forbidden_extensions
-        if queue.consumer_kwargs["forbidden_extensions"]:
-            forbidden_extensions += queue.consumer_kwargs["forbidden_extensions"]
-
-        if is_extension_forbidden("mp4", allowed_extensions, forbidden_extensions):
+        if queue.rules.is_extension_forbidden("mp4"):
             return
 
         await zoom.download(session=session,
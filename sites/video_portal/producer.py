@@ -1,6 +1,7 @@
 import asyncio
 import os
 
+from core import local_index
 from core.utils import safe_path_join
 from settings.config import ConfigString
 from sites.video_portal.constants import BASE_URL
@@ -15,7 +16,7 @@ PWD_PASSWORD_CONFIG = ConfigString(gui_name="Series Password", optional=True)
 
 async def get_meta_data(session, course_url):
     meta_url = course_url + ".series-metadata.json"
-    async with session.get(meta_url) as response:
+    async with session.get_cached(meta_url, persistent=True) as response:
         meta_data = await response.json()
 
     return meta_data
@@ -44,10 +45,7 @@ async def producer(session,
 
     meta_data = await get_meta_data(session, course_url)
 
-    if os.path.exists(absolute_path):
-        downloaded_episodes = os.listdir(absolute_path)
-    else:
-        downloaded_episodes = []
+    downloaded_episodes = local_index.listdir(absolute_path)
 
     tasks = []
     for episode in meta_data["episodes"]: